@@ -1,20 +1,103 @@
 #!/usr/bin/python3
 
-from math import pi
-from scipy import signal
+from math import pi, ceil, log
+import numpy as np
+from scipy import signal, linalg
 from filter import Filter
+import response
 import custom
 
 
 class AnalogFilter(Filter):
 
    def compute_parameters(self):
-        self._compute_parameters()
+        self._compute_parameters_cached()
 
    def design(self):
-        self._design() # It computes Z, P, K for numerical stability.
+        self._design_cached() # It computes Z, P, K for numerical stability.
         self.B, self.A = signal.zpk2tf(self.Z, self.P, self.K)
 
+   def log_response(self, start=None, stop=None, N=1000, db=False):
+        """ The response on N points, logarithmically spaced from start to
+            stop (in Hz; by default, the range signal.freqs would choose).
+            Returns the frequencies (Hz) and H, or, with db, the frequencies,
+            the magnitude in dB and the phase in degrees -- straight from
+            the factors, with no unwrapping. The grid is built once for
+            each range and reused. """
+        if self.P is None:
+            raise ValueError("Design the filter before evaluating it.")
+        if start is None or stop is None:
+            W = signal.findfreqs(self.Z, self.P, 2, kind='zp')
+            start = W[0] / (2 * pi) if start is None else start
+            stop = W[-1] / (2 * pi) if stop is None else stop
+        grid = response.log_grid(float(start), float(stop), N)
+
+        log_H = response.zpk_log_response(self.Z, self.P, self.K, grid.angular(),
+                                          analog=True)
+        if not db:
+            return grid.frequencies(), np.exp(log_H)
+        return (grid.frequencies(), log_H.real * (20 / np.log(10)),
+                np.degrees(log_H.imag))
+
+   def impulse_response(self, tolerance=1e-6, max_length=1 << 20):
+        """ Returns (T, h): the impulse response, sampled at the times T
+            until the slowest pole has decayed to tolerance. The samples
+            are exact: the state-space model is stepped with expm(A dt),
+            with no integration error. Filters with a direct term (as
+            highpass ones) also have a Dirac impulse at 0, left out here. """
+        A, B, C, D, dt, length = self._discretize(tolerance, max_length)
+        states = self._powers(linalg.expm(A * dt), B[:, 0], length)
+        return np.arange(length) * dt, C[0] @ states
+
+   def step_response(self, tolerance=1e-6, max_length=1 << 20):
+        """ Returns (T, s): the step response, on the same times as
+            impulse_response(). A step is constant between the samples,
+            so holding it (zero-order hold) is exact too. """
+        A, B, C, D, dt, length = self._discretize(tolerance, max_length)
+        order = len(A)
+        # expm of [[A, B], [0, 0]] dt holds the step's Phi and Gamma.
+        augmented = np.zeros((order + 1, order + 1))
+        augmented[:order, :order] = A
+        augmented[:order, order] = B[:, 0]
+        held = linalg.expm(augmented * dt)
+        phi, gamma = held[:order, :order], held[:order, order]
+
+        # x[k] = sum of phi^j gamma for j < k.
+        states = np.cumsum(self._powers(phi, gamma, length), axis=1)
+        states = np.hstack([np.zeros((order, 1)), states[:, :-1]])
+        return np.arange(length) * dt, C[0] @ states + D[0, 0]
+
+   def _discretize(self, tolerance, max_length):
+        """ The state-space model, and a time step and length: the step
+            resolves the fastest pole (20 steps per its period), the
+            length lets the slowest one decay to tolerance. """
+        if self.P is None:
+            raise ValueError("Design the filter before simulating it.")
+        poles = np.asarray(self.P)
+        if not len(poles) or np.max(poles.real) >= 0:
+            raise ValueError("Only stable filters, with poles in the left "
+                             "half-plane, have a response that dies out.")
+        A, B, C, D = signal.zpk2ss(self.Z, self.P, self.K)
+
+        duration = log(1 / tolerance) / -np.max(poles.real)
+        dt = pi / (10 * np.max(np.abs(poles)))
+        length = int(ceil(duration / dt)) + 1
+        if length > max_length:
+            length = max_length
+            dt = duration / (length - 1)
+        return A, B, C, D, dt, length
+
+   @staticmethod
+   def _powers(matrix, vector, length):
+        """ The columns vector, matrix vector, matrix^2 vector... (length
+            of them), by doubling: log2(length) matrix products. """
+        columns = vector[:, np.newaxis]
+        power = matrix
+        while columns.shape[1] < length:
+            columns = np.hstack([columns, power @ columns])
+            power = power @ power
+        return columns[:, :length]
+
    def _compute_parameters(self):
         raise ValueError("Please override me with your own _compute_parameters function!")
 
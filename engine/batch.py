@@ -0,0 +1,170 @@
+#!/usr/bin/python3
+# coding: utf-8
+
+# pyfilter: a Python program for filter synthesis
+# (c) 2015 Renan Birck <renan.ee.ufsm@gmail.com>
+
+""" This module designs many filters at once, for parameter sweeps.
+    The designs are spread over a pool of processes, and come back as
+    one compact result set instead of thousands of filter objects. """
+
+import os
+from math import pi
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from filter import FilterSpec
+import digital
+import analog_new
+
+# The modules where the families named in the specs live,
+# as in FilterSpec.family ('digital.EllipticFilter', ...).
+FAMILY_MODULES = {'digital': digital, 'analog_new': analog_new}
+
+
+class DesignResultSet():
+    """ The result of design_many(). For the i-th spec:
+
+        - orders[i] is the order N (-1 if the design failed, and then
+          errors[i] tells why);
+        - wn[i] holds Wn (one or two values, the unused one is NaN);
+        - the numerator is b[b_offsets[i]:b_offsets[i + 1]], and the
+          same goes for the denominator with a and a_offsets;
+        - if verified, passed[i] tells whether the design meets its spec,
+          and margins[i] holds the worst margin (dB) of each band, in the
+          order of Filter.band_edges() (NaN for the unused ones). """
+
+    orders = None
+    wn = None
+    b, b_offsets = None, None
+    a, a_offsets = None, None
+    errors = None
+    passed = None
+    margins = None
+
+    def __init__(self, results):
+        count = len(results)
+        self.orders = np.full(count, -1, dtype=np.int32)
+        self.wn = np.full((count, 2), np.nan)
+        self.errors = [None] * count
+
+        if any(margins is not None for (_, _, _, _, _, margins) in results):
+            self.passed = np.zeros(count, dtype=bool)
+            self.margins = np.full((count, 3), np.nan)
+
+        b_lengths = np.zeros(count, dtype=np.int64)
+        a_lengths = np.zeros(count, dtype=np.int64)
+        for idx, (N, Wn, B, A, error, margins) in enumerate(results):
+            if error is not None:
+                self.errors[idx] = error
+                continue
+            if margins is not None:
+                self.margins[idx, :len(margins)] = margins
+                self.passed[idx] = np.all(np.asarray(margins) >= -1e-6)
+            self.orders[idx] = N
+            Wn = np.atleast_1d(Wn)
+            self.wn[idx, :len(Wn)] = Wn
+            b_lengths[idx] = len(B)
+            a_lengths[idx] = len(A)
+
+        self.b_offsets = np.concatenate(([0], np.cumsum(b_lengths)))
+        self.a_offsets = np.concatenate(([0], np.cumsum(a_lengths)))
+        self.b = np.concatenate([np.real(B) for (_, _, B, _, error, _) in results
+                                 if error is None] or [np.zeros(0)])
+        self.a = np.concatenate([np.real(A) for (_, _, _, A, error, _) in results
+                                 if error is None] or [np.zeros(0)])
+
+    def __len__(self):
+        return len(self.orders)
+
+    def coefficients(self, idx):
+        """ Returns (B, A) of the idx-th design, as views. """
+        return (self.b[self.b_offsets[idx]:self.b_offsets[idx + 1]],
+                self.a[self.a_offsets[idx]:self.a_offsets[idx + 1]])
+
+
+def _normalize_spec(spec):
+    """ Turns a FilterSpec (rad/s, as given by Filter.get_spec()) or a
+        dictionary (Hz, like set_parameters() takes, plus 'family' and
+        optionally 'sample_rate', 'ripple' and 'target') into a small
+        dictionary that is cheap to send to the workers. """
+    if isinstance(spec, FilterSpec):
+        to_hz = lambda x: [value / (2 * pi) for value in x] if isinstance(x, tuple) else x / (2 * pi)
+        options = dict(spec.options)
+        spec = {'family': spec.family,
+                'passband_frequency': to_hz(spec.passband_frequency),
+                'stopband_frequency': to_hz(spec.stopband_frequency),
+                'passband_attenuation': spec.passband_attenuation,
+                'stopband_attenuation': spec.stopband_attenuation,
+                'ripple': spec.ripple,
+                'sample_rate': spec.sample_rate,
+                'target': options.get('target')}
+    return dict(spec)
+
+
+def _design_one(spec, verify=False):
+    """ Designs one spec, returning (N, Wn, B, A, error, margins);
+        margins is None unless verify is set (see Filter.verify). """
+    try:
+        module_name, class_name = spec['family'].rsplit('.', 1)
+        design = getattr(FAMILY_MODULES[module_name], class_name)()
+
+        parameters = {}
+        for name in ['passband_frequency', 'stopband_frequency',
+                     'passband_attenuation', 'stopband_attenuation', 'ripple']:
+            if spec.get(name) is not None:
+                parameters[name] = spec[name]
+        for name in ['passband_frequency', 'stopband_frequency']:
+            if isinstance(parameters[name], (list, tuple)):
+                parameters[name] = [float(value) for value in parameters[name]]
+            else:
+                parameters[name] = float(parameters[name])
+
+        if spec.get('sample_rate'):
+            design.sample_rate = spec['sample_rate']
+        if hasattr(design, 'target'):
+            design.target = spec.get('target') or 'passband'
+
+        design.set_parameters(parameters)
+        design.compute_parameters()
+        design.design()
+        margins = None
+        if verify:
+            _, found = design.verify(early_exit=False)
+            margins = [band.margin for band in found]
+        return (design.N, design.Wn, design.B, design.A, None, margins)
+    except Exception as went_wrong:
+        return (-1, None, None, None, '{}: {}'.format(type(went_wrong).__name__, went_wrong),
+                None)
+
+
+def _design_chunk(specs, verify=False):
+    return [_design_one(spec, verify) for spec in specs]
+
+
+def design_many(specs, jobs=None, chunk_size=None, verify=False):
+    """ Computes the parameters of, and designs, every spec in specs
+        (FilterSpecs or dictionaries, see _normalize_spec). The work is
+        spread over jobs processes (all the CPUs if None, no pool if 1),
+        chunk_size specs at a time. With verify, every design is also
+        checked against its spec. Returns a DesignResultSet. """
+    specs = [_normalize_spec(spec) for spec in specs]
+    if not specs:
+        return DesignResultSet([])
+
+    if jobs == 1:
+        return DesignResultSet(_design_chunk(specs, verify))
+
+    jobs = jobs or os.cpu_count() or 1
+    if chunk_size is None:
+        # A few chunks per worker keeps them all busy till the end.
+        chunk_size = max(1, len(specs) // (4 * jobs))
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        chunks = [specs[start:start + chunk_size]
+                  for start in range(0, len(specs), chunk_size)]
+        results = []
+        for chunk_results in pool.map(partial(_design_chunk, verify=verify), chunks):
+            results.extend(chunk_results)
+
+    return DesignResultSet(results)
@@ -0,0 +1,205 @@
+#!/usr/bin/python3
+# coding: utf-8
+
+# pyfilter: a Python program for filter synthesis
+# (c) 2015 Renan Birck <renan.ee.ufsm@gmail.com>
+
+""" This module has the caches used to avoid designing the same
+    filter again and again. """
+
+import os
+import hashlib
+import tempfile
+import zipfile
+from collections import OrderedDict
+import numpy as np
+import scipy
+
+
+class LRUCache():
+    """ A dictionary that holds at most maxsize entries, throwing
+        away the least recently used one when it is full. It also
+        counts the hits and misses, to know if it is worth it.
+
+        With max_bytes, it also throws entries away while the arrays
+        stored in it add up to more than that. """
+
+    maxsize = None
+    max_bytes = None
+    nbytes = 0
+    hits = 0
+    misses = 0
+
+    def __init__(self, maxsize=1024, max_bytes=None):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._sizes = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """ Returns the value stored for key (counting a hit),
+            or default (counting a miss). """
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """ Stores the value for key, evicting old entries if needed. """
+        if key in self._entries:
+            self.nbytes -= self._sizes.pop(key)
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        self._sizes[key] = array_bytes(value)
+        self.nbytes += self._sizes[key]
+        while len(self._entries) > self.maxsize or \
+              (self.max_bytes is not None and self.nbytes > self.max_bytes and
+               len(self._entries) > 1):
+            old_key, _ = self._entries.popitem(last=False)
+            self.nbytes -= self._sizes.pop(old_key)
+
+    def clear(self):
+        """ Empties the cache and zeroes the counters. """
+        self._entries.clear()
+        self._sizes.clear()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        """ Returns the statistics of the cache as a dictionary. """
+        info = {'hits': self.hits, 'misses': self.misses,
+                'size': len(self._entries), 'maxsize': self.maxsize}
+        if self.max_bytes is not None:
+            info.update(bytes=self.nbytes, max_bytes=self.max_bytes)
+        return info
+
+
+def array_bytes(value):
+    """ The bytes taken by the arrays in value (an array, or a tuple,
+        list or dictionary of them). Anything else counts as nothing. """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        value = value.values()
+    if isinstance(value, (tuple, list, type({}.values()))):
+        return sum(array_bytes(item) for item in value)
+    return 0
+
+
+class DiskCache():
+    """ Finished designs (and responses) stored as .npz files in a
+        directory, so that other processes, and later runs, can reuse
+        them. Each file is named by a hash of the spec and of the SciPy
+        version, since another SciPy may design differently.
+
+        Files are written to a temporary name and then renamed, so many
+        processes can share the directory. When the files add up to more
+        than max_bytes, the least recently read ones are removed. """
+
+    directory = None
+    max_bytes = None
+    hits = 0
+    misses = 0
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, key):
+        """ Returns the file name for the key: a spec, or a tuple of
+            a spec and whatever else tells what is stored. """
+        text = repr(key) + ' scipy ' + scipy.__version__
+        digest = hashlib.sha256(text.encode('UTF-8')).hexdigest()
+        return os.path.join(self.directory, digest + '.npz')
+
+    def get(self, key):
+        """ Returns the arrays stored for key as a dictionary,
+            or None if there are none. """
+        path = self.path_for(key)
+        try:
+            with np.load(path) as stored:
+                arrays = {name: stored[name] for name in stored.files}
+            os.utime(path)  # Mark it as recently used.
+        except (OSError, ValueError, zipfile.BadZipFile):
+            # Not there, or removed by another process meanwhile.
+            self.misses += 1
+            return None
+        self.hits += 1
+        return arrays
+
+    def put(self, key, arrays):
+        """ Stores the dictionary of arrays for key. """
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as output:
+                np.savez(output, **arrays)
+            os.replace(temporary, self.path_for(key))
+        except BaseException:
+            os.remove(temporary)
+            raise
+        self.evict()
+
+    def evict(self):
+        """ Removes the least recently used files until the total
+            size is below max_bytes. """
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npz'):
+                try:
+                    info = entry.stat()
+                except OSError:
+                    continue
+                files.append((info.st_atime, info.st_size, entry.path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # Someone else removed it first.
+            total -= size
+
+    def clear(self):
+        """ Removes every file of the cache and zeroes the counters. """
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npz'):
+                os.remove(entry.path)
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        """ Returns the statistics of the cache as a dictionary. """
+        files = [entry for entry in os.scandir(self.directory)
+                 if entry.name.endswith('.npz')]
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(files), 'bytes': sum(entry.stat().st_size for entry in files),
+                'max_bytes': self.max_bytes}
+
+
+# Results of _compute_parameters (N, Wn) and of _design (Z, P, K),
+# keyed by FilterSpec. Shared by every filter family. Bounded by bytes
+# too: a long FIR design holds its taps, and its window for Kaiser ones.
+parameters_cache = LRUCache(maxsize=1024, max_bytes=16 * 1024 * 1024)
+design_cache = LRUCache(maxsize=1024, max_bytes=128 * 1024 * 1024)
+
+# Frequency responses (W, H), keyed by a hash of the coefficients and
+# by the points asked for.
+response_cache = LRUCache(maxsize=256, max_bytes=64 * 1024 * 1024)
+
+# Windows of the FIR designs, keyed by (name, taps, parameters), and the
+# phase ramps of the large ones. Bounded by bytes: long windows are big.
+window_cache = LRUCache(maxsize=256, max_bytes=32 * 1024 * 1024)
@@ -21,7 +21,63 @@ from scipy import special, optimize
 from scipy.special import comb
 from scipy.signal import band_stop_obj
 
-def custom_buttord(wp, ws, gpass, gstop, analog=False):
+def _band_stop_nat(p0, p1, stopb):
+    """ The lowpass prototype stopband edge of a bandstop filter with
+        passband edges p0, p1 (the worst of the two stopband edges). """
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        nat = abs((stopb * (p0 - p1)[..., None]) /
+                  (stopb ** 2 - (p0 * p1)[..., None]))
+    return numpy.min(nat, axis=-1)
+
+
+def _band_stop_search(lower, upper, fixed, stopb, ind):
+    """ Finds, in [lower, upper], the passband edge ind (the other one
+        being fixed) that gives the largest prototype stopband edge.
+
+        Each stopband edge alone gets better as the moving passband edge
+        goes towards its pole, so the best of the worst is at an end of
+        the interval or where both stopband edges give the same value.
+        Solving that equality gives p0 * p1 = s0 * s1. """
+    crossing = numpy.clip(stopb[..., 0] * stopb[..., 1] / fixed, lower, upper)
+    candidates = numpy.stack([lower, crossing, upper], axis=-1)
+    fixed = fixed[..., None]
+    if ind == 0:
+        nat = _band_stop_nat(candidates, fixed * numpy.ones_like(candidates),
+                             stopb[..., None, :])
+    else:
+        nat = _band_stop_nat(fixed * numpy.ones_like(candidates), candidates,
+                             stopb[..., None, :])
+    nat = numpy.where(numpy.isnan(nat), -numpy.inf, nat)
+    best = numpy.argmax(nat, axis=-1)
+    return numpy.take_along_axis(candidates, best[..., None], axis=-1)[..., 0]
+
+
+def band_stop_edges(passb, stopb):
+    """Passband edges that minimize the order of a Butterworth bandstop.
+    This replaces the two `optimize.fminbound` searches over
+    `band_stop_obj` with a closed form: the lower passband edge is moved
+    first (in [passb[0], stopb[0])), then the upper one (in
+    (stopb[1], passb[1]]), like the searches did. The result agrees with
+    them to within their tolerance, and works on arrays of specs.
+    Parameters
+    ----------
+    passb, stopb : array_like, shape (2,) or (n, 2)
+        Passband and stopband edges (pre-warped for digital filters).
+    Returns
+    -------
+    passb : ndarray, same shape
+        The new passband edges.
+    """
+    passb = array(passb, dtype=float)
+    stopb = asarray(stopb, dtype=float)
+    lower = _band_stop_search(passb[..., 0], stopb[..., 0] - 1e-12,
+                              passb[..., 1], stopb, 0)
+    upper = _band_stop_search(stopb[..., 1] + 1e-12, passb[..., 1],
+                              lower, stopb, 1)
+    return numpy.stack([lower, upper], axis=-1)
+
+
+def custom_buttord(wp, ws, gpass, gstop, analog=False, fast=True):
     """Butterworth filter order selection.
     Return the order of the lowest order digital or analog Butterworth filter
     that loses no more than `gpass` dB in the passband and has at least
@@ -45,6 +101,15 @@ def custom_buttord(wp, ws, gpass, gstop, analog=False):
     analog : bool, optional
         When True, return an analog filter, otherwise a digital filter is
         returned.
+    fast : bool, optional
+        For bandstop filters, find the passband edges with the closed
+        form in `band_stop_edges` (the default) instead of the
+        `optimize.fminbound` searches (the same ones MATLAB does). The
+        two agree to within the tolerance of the searches, but when the
+        exact order is just below an integer (about one spec in 2000)
+        the searches stop short of the optimum and return one more than
+        needed; the closed form gives the lower order, which meets the
+        spec.
     Returns
     -------
     ord : int
@@ -100,6 +165,10 @@ def custom_buttord(wp, ws, gpass, gstop, analog=False):
         nat = stopb / passb
     elif filter_type == 2:          # high
         nat = passb / stopb
+    elif filter_type == 3 and fast:  # stop
+        passb = band_stop_edges(passb, stopb)
+        nat = ((stopb * (passb[0] - passb[1])) /
+               (stopb ** 2 - passb[0] * passb[1]))
     elif filter_type == 3:          # stop
         wp0 = optimize.fminbound(band_stop_obj, passb[0], stopb[0] - 1e-12,
                                  args=(0, passb, stopb, gpass, gstop,
@@ -162,3 +231,96 @@ def custom_buttord(wp, ws, gpass, gstop, analog=False):
     if len(wn) == 1:
         wn = wn[0]
     return ord, wn
+
+def custom_buttord_many(wp, ws, gpass, gstop, analog=False):
+    """Butterworth filter order selection for many specs at once.
+    This is custom_buttord (which stays the reference), vectorized: each
+    row of the arguments is one spec, and all of them are computed in
+    one NumPy pass. Bandstop specs use `band_stop_edges`, as
+    custom_buttord does by default.
+    Parameters
+    ----------
+    wp, ws : array_like
+        Passband and stopband edge frequencies, as in `custom_buttord`.
+        Shape (n,) for lowpass and highpass specs (each row can be either),
+        shape (n, 2) for bandpass and bandstop specs.
+    gpass, gstop : float or array_like
+        The maximum loss in the passband and the minimum attenuation in
+        the stopband (dB), for all specs or one per spec.
+    analog : bool, optional
+        When True, the specs are for analog filters, otherwise digital.
+    Returns
+    -------
+    ord : ndarray of int, shape (n,)
+        The lowest orders for Butterworth filters which meet the specs.
+    wn : ndarray, shape (n,) or (n, 2)
+        The Butterworth natural frequencies.
+    """
+    wp = asarray(wp, dtype=float)
+    ws = asarray(ws, dtype=float)
+    if wp.shape != ws.shape or wp.ndim not in (1, 2) or \
+       (wp.ndim == 2 and wp.shape[1] != 2):
+        raise ValueError("wp and ws must both have shape (n,) or (n, 2).")
+    band = wp.ndim == 2
+
+    # Pre-warp frequencies for digital filter design
+    if not analog:
+        passb = tan(pi * wp / 2.0)
+        stopb = tan(pi * ws / 2.0)
+    else:
+        passb = wp * 1.0
+        stopb = ws * 1.0
+
+    if not band:
+        low = wp < ws
+        nat = numpy.where(low, stopb / passb, passb / stopb)
+    else:
+        stop = wp[:, 0] < ws[:, 0]
+        passb = numpy.where(stop[:, None], band_stop_edges(passb, stopb), passb)
+        bandwidth = passb[:, 0] - passb[:, 1]
+        product = passb[:, 0] * passb[:, 1]
+        nat = ((stopb ** 2 - product[:, None]) /
+               (stopb * bandwidth[:, None]))
+        nat = numpy.where(stop[:, None], 1 / nat, nat)
+        nat = numpy.min(abs(nat), axis=1)
+
+    GSTOP = 10 ** (0.1 * abs(asarray(gstop, dtype=float)))
+    GPASS = 10 ** (0.1 * abs(asarray(gpass, dtype=float)))
+    ord = ceil(log10((GSTOP - 1.0) / (GPASS - 1.0)) /
+               (2 * log10(nat))).astype(int)
+
+    # Find the Butterworth natural frequency WN (or the "3dB" frequency")
+    # to give exactly gstop at nat. Order zero gets W0 = 1, as in the
+    # scalar version.
+    zero = ord == 0
+    safe_ord = numpy.where(zero, 1, ord)
+    W0 = numpy.where(zero, 1.0, nat / ((GSTOP - 1) ** (1.0 / (2.0 * safe_ord))))
+
+    # now convert this frequency back from lowpass prototype
+    # to the original analog filter
+
+    if not band:
+        WN = numpy.where(low, W0 * passb, passb / W0)
+    else:
+        difference = (passb[:, 1] - passb[:, 0])[:, None]
+        product = product[:, None]
+
+        # Bandstop
+        discr = sqrt(difference ** 2 + 4 * W0[:, None] ** 2 * product)
+        stop_WN = numpy.stack([(difference[:, 0] + discr[:, 0]) / (2 * W0),
+                               (difference[:, 0] - discr[:, 0]) / (2 * W0)], axis=1)
+
+        # Bandpass
+        W0 = numpy.stack([-W0, W0], axis=1)
+        pass_WN = (-W0 * difference / 2.0 +
+                   sqrt(W0 ** 2 / 4.0 * difference ** 2 + product))
+
+        WN = numpy.where(stop[:, None], stop_WN, pass_WN)
+        WN = numpy.sort(abs(WN), axis=1)
+
+    if not analog:
+        wn = (2.0 / pi) * arctan(WN)
+    else:
+        wn = WN
+
+    return ord, wn
@@ -1,15 +1,208 @@
 #!/usr/bin/python3
 # coding: utf-8
 
-from math import pi
-from scipy import signal
-from filter import Filter
+import os
+from math import pi, ceil, log
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from scipy import signal, fft
+from filter import Filter, FilterSpec, freeze
+import cache
 import custom
+import leastsq
 
 hz_to_rad = lambda x: 2 * pi * float(x)
 rad_to_hz = lambda x: float(x) / (2 * pi)
 
-class FIRFilter(Filter):
+# Cost of one FFT + inverse FFT pair, per n*log2(n), relative to one
+# multiply-accumulate of direct convolution. Measured with
+# scripts/convbench.py; it decides when FIRFilter switches to overlap-save.
+FFT_COST_RATIO = 8.0
+
+# From this many taps on, window designs skip firwin2: steps in the gains
+# use the closed form of firwin, anything else frequency sampling with a
+# cached window and phase ramp. Measured with scripts/firbench.py.
+LARGE_FIR_TAPS = 1024
+
+# dB asked of kaiserord above the spec: its estimate is a fit, and a
+# sidelobe peak can fall between the points verify() looks at.
+KAISER_HEADROOM = 0.5
+
+# Samples (of all the channels together) that process() hands to SciPy at
+# a time from a block that is not C-contiguous, which SciPy would copy.
+PROCESS_CHUNK = 1 << 16
+
+# The gains of each band, from 0 Hz up, of the FIR designs made from
+# filter_parameters.
+STEP_GAINS = {'lowpass': [1, 0], 'highpass': [0, 1],
+              'bandpass': [0, 1, 0], 'bandstop': [1, 0, 1]}
+
+# What FIRFilter.prewarm_windows() computes by default: the windows of the
+# GUI that have no parameters, at the usual (power of two) lengths.
+PREWARM_WINDOWS = ('boxcar', 'triang', 'hamming', 'hann')
+PREWARM_SIZES = tuple(2 ** k for k in range(6, 17))
+
+class DigitalFilter(Filter):
+    """ Common code for the FIR and IIR filters: applying a designed
+        filter to a stream of samples, block by block. The filter state
+        is kept between the calls, so filtering a signal in blocks of
+        any size gives the same result as filtering it all at once.
+
+        A block can also be a (channels x samples) array (or any array
+        with time on the last axis): all the channels are filtered in
+        one call, each with its own state. Any memory order is taken:
+        blocks that are not C-contiguous (like F-ordered ones) are filtered
+        PROCESS_CHUNK samples at a time, so that SciPy copies no more than
+        that, and the output comes in the same order. """
+
+    sample_rate = None
+    _state = None  # Allocated on the first block, then updated in place.
+    _channels = None  # The shape of the block, except the time axis.
+
+    def reset(self):
+        """ Forgets the filter state, as if the past input was zero. """
+        self._state = None
+        self._channels = None
+
+    def process(self, block):
+        """ Filters one block of samples and returns the output block.
+            Complex blocks give complex outputs (and a complex state). """
+        block = np.asarray(block)
+        if block.dtype.kind not in 'fc':
+            block = block.astype(float)
+
+        if self._state is None:
+            self._channels = block.shape[:-1]
+            self._state = self._initial_state(self._channels)
+        elif block.shape[:-1] != self._channels:
+            raise ValueError("Block has shape {}, but the filter state is for {} "
+                             "channels. Call reset() first.".format(block.shape,
+                                                                    self._channels))
+        dtype = np.result_type(block, self._state)
+        if self._state.dtype != dtype:
+            # Once, on the first complex block: a real state would drop the
+            # imaginary part of what it keeps.
+            self._state = self._state.astype(dtype)
+
+        if block.shape[-1] == 0:  # Nothing to do, and the state stays.
+            return np.zeros(block.shape, dtype)
+        if block.flags.c_contiguous:
+            return self._filter_block(block)
+
+        output = np.empty_like(block, dtype=dtype)
+        # Long filters need chunks well over their state, for the FFTs to pay.
+        step = max(PROCESS_CHUNK // max(1, int(np.prod(self._channels))),
+                   4 * self._state.shape[-1], 1)
+        for start in range(0, block.shape[-1], step):
+            output[..., start:start + step] = self._filter_block(block[..., start:start + step])
+        return output
+
+    def process_stream(self, blocks):
+        """ Generator version of process(): filters every block
+            yielded by the iterable blocks. """
+        for block in blocks:
+            yield self.process(block)
+
+    def pole_radius(self):
+        """ The largest magnitude among the poles (0 for FIR filters):
+            how slowly the response dies out. """
+        if self.P is not None:
+            poles = np.asarray(self.P)
+        elif self.SOS is not None:
+            poles = np.concatenate([np.roots(section[3:]) for section in self.SOS])
+        elif self.A is not None and np.size(self.A) > 1:
+            poles = np.roots(self.A)
+        else:
+            return 0.0
+        return float(np.max(np.abs(poles))) if len(poles) else 0.0
+
+    def response_length(self, tolerance=1e-6, max_length=1 << 20):
+        """ The samples it takes for the impulse response to fall below
+            tolerance times its peak: the taps of an FIR filter, or the
+            n for which radius^n = tolerance, for the slowest pole. """
+        if self.B is None:
+            raise ValueError("Design the filter before simulating it.")
+        radius = self.pole_radius()
+        if radius >= 1:
+            raise ValueError("The filter has a pole at radius {}, so its response "
+                             "never dies out.".format(radius))
+        length = len(np.atleast_1d(self.B))
+        if radius > 0:
+            length += int(ceil(log(tolerance) / log(radius)))
+        return min(length, max_length)
+
+    def impulse_response(self, tolerance=1e-6, max_length=1 << 20):
+        """ Returns (T, h): the impulse response h, at the times T (in
+            seconds), long enough to fall below tolerance times its peak
+            (see response_length), but no longer than max_length. """
+        length, h = self._settled_impulse(tolerance, max_length)
+        return np.arange(length) / self.sample_rate, h
+
+    def step_response(self, tolerance=1e-6, max_length=1 << 20):
+        """ Returns (T, s): the step response, as long as the impulse
+            response impulse_response() would give. """
+        length, _ = self._settled_impulse(tolerance, max_length)
+        return np.arange(length) / self.sample_rate, self._run(np.ones(length))
+
+    def _settled_impulse(self, tolerance, max_length):
+        """ Simulates the impulse for response_length() samples, doubling
+            it while the last tenth is still above the tolerance (as with
+            clustered poles, which die out slower than the radius says). """
+        length = self.response_length(tolerance, max_length)
+        while True:
+            impulse = np.zeros(length)
+            impulse[0] = 1.0
+            h = self._run(impulse)
+            if self.pole_radius() == 0 or length >= max_length:
+                return length, h
+            tail = h[-max(1, length // 10):]
+            if np.max(np.abs(tail)) <= tolerance * np.max(np.abs(h)):
+                return length, h
+            length = min(2 * length, max_length)
+
+    def _run(self, samples):
+        """ Filters samples from rest, through the sections if any. """
+        if self.SOS is not None:
+            return signal.sosfilt(self.SOS, samples)
+        A = self.A if self.A is not None else 1.0
+        return signal.lfilter(self.B, A, samples)
+
+    def zoom_response(self, start, stop, N=1024):
+        """ Computes the frequency response on N points from start to stop
+            (both in Hz, and both included), with the chirp-Z transform:
+            it costs O((taps + N) log(taps + N)), whatever the width of
+            the band, so narrow bands can be seen in fine detail. Like
+            compute_frequencies(), it sets W (radians/sample) and H. """
+        if not 0 <= start < stop <= self.sample_rate:
+            raise ValueError("The band must be within 0 and the sample rate, "
+                             "with start < stop.")
+
+        if self.SOS is not None:
+            # Every section at once: one transform of length 3 each.
+            zoom = signal.ZoomFFT(3, [start, stop], N, fs=self.sample_rate,
+                                  endpoint=True)
+            sections = zoom(self.SOS[:, :3]) / zoom(self.SOS[:, 3:])
+            H = np.prod(sections, axis=0)
+        else:
+            A = np.atleast_1d(self.A) if self.A is not None else np.ones(1)
+            length = max(len(self.B), len(A))
+            zoom = signal.ZoomFFT(length, [start, stop], N, fs=self.sample_rate,
+                                  endpoint=True)
+            H = zoom(np.pad(self.B, (0, length - len(self.B))))
+            if len(A) > 1 or A[0] != 1:
+                H = H / zoom(np.pad(A, (0, length - len(A))))
+
+        self.W = 2 * pi * np.linspace(start, stop, N) / self.sample_rate
+        self.H = H
+
+    def _initial_state(self, channels):
+        raise ValueError("Please override me with your own _initial_state function!")
+
+    def _filter_block(self, block):
+        raise ValueError("Please override me with your own _filter_block function!")
+
+class FIRFilter(DigitalFilter):
     sample_rate = None
     taps = None
     freqs = None
@@ -20,6 +213,9 @@ class FIRFilter(Filter):
     _nyquist = None
     antisymmetric = None
     B = None
+    window_cache = cache.window_cache  # Shared by every FIR design.
+    _spectra = None  # rfft of B, per FFT size, for the overlap-save engine.
+    _spectra_B = None
 
     def __init__(self, sample_rate=None, taps=None, freqs=None, gains=None, window=None,
                  antisymmetric=False):
@@ -52,24 +248,168 @@ class FIRFilter(Filter):
             return 4
         return 0
 
+    def compute_parameters(self, max_adjust=3):
+        """ Designs from filter_parameters (the band edges, the ripple as
+            passband_attenuation and the stopband_attenuation, in dB), like
+            the IIR filters do, with a Kaiser window. The taps and beta are
+            estimated in closed form (signal.kaiserord), and the design is
+            verified. While it misses the spec (at most max_adjust times),
+            the attenuation asked of kaiserord grows by what was missing,
+            which adds a few taps. Sets taps, window, freqs and gains;
+            design() is then a cache hit. """
+        parameters = self.filter_parameters
+        nyquist = self.sample_rate / 2
+        passband = np.atleast_1d(parameters['passband_frequency']) / (2 * pi)
+        stopband = np.atleast_1d(parameters['stopband_frequency']) / (2 * pi)
+
+        # The window ripples the same in both bands, so the tighter one rules.
+        passband_gain = 10 ** (parameters['passband_attenuation'] / 20)
+        ripple = min((passband_gain - 1) / (passband_gain + 1),
+                     10 ** (-parameters['stopband_attenuation'] / 20))
+        attenuation = -20 * np.log10(ripple) + KAISER_HEADROOM
+        width = np.min(np.abs(passband - stopband)) / nyquist
+
+        edges = list((passband + stopband) / 2)
+        gains = STEP_GAINS[self.filter_kind]
+        self.freqs = [0.0] + [edge for edge in edges for _ in range(2)] + [nyquist]
+        self.gains = [float(gain) for gain in gains for _ in range(2)]
+        self.antisymmetric = False
+        self.algorithm = 'kaiser'  # The windowed sincs kaiserord assumes.
+
+        previous = 0
+        for _ in range(max_adjust + 1):
+            taps, beta = signal.kaiserord(attenuation, width)
+            taps = taps + 1 - taps % 2  # Odd: type 1 can pass any band.
+            self.taps = previous = max(taps, previous + 2 if previous else 0)
+            self.window = ('kaiser', float(beta))
+            self.design()
+
+            passed, margins = self.verify()
+            if passed:
+                break
+            attenuation += max(self._missing_attenuation(band) for band in margins)
+
+    @staticmethod
+    def _missing_attenuation(band):
+        """ How many dB more kaiserord must ask for to fix the band. """
+        if band.margin >= 0:
+            return 0.0
+        if band.kind == 'stop':
+            return -band.margin
+        # The passband deviation, in dB, goes with the ripple.
+        return 20 * np.log10(-band.worst[1] / -band.limit)
+
+    def compute_remez_parameters(self, jobs=None, maxiter=25, max_taps=8192):
+        """ Like compute_parameters(), but finds the shortest Remez
+            (Parks-McClellan) design that meets the spec. Kaiser's formula
+            gives a first guess; lengths around it are tried until one
+            passes and a shorter one fails, then the bracket is narrowed
+            down to a single step. Each round tries jobs lengths at once in
+            a pool of processes (all the CPUs if None, no pool if 1), and
+            stops as soon as the minimum is confirmed. Longer designs are
+            assumed to do no worse, as they almost always do.
+
+            Sets taps, freqs, gains and weights and leaves it designed. """
+        parameters = self.filter_parameters
+        nyquist = self.sample_rate / 2
+        passband = np.atleast_1d(parameters['passband_frequency']) / (2 * pi)
+        stopband = np.atleast_1d(parameters['stopband_frequency']) / (2 * pi)
+
+        pass_ripple = 1 - 10 ** (-parameters['passband_attenuation'] / 20)
+        stop_ripple = 10 ** (-parameters['stopband_attenuation'] / 20)
+        width = np.min(np.abs(passband - stopband)) / self.sample_rate
+
+        gains = STEP_GAINS[self.filter_kind]
+        self.freqs = [0.0] + sorted(float(edge) for edge in np.concatenate((passband, stopband))) \
+            + [nyquist]
+        self.gains = [float(gain) for gain in gains]
+        # Each band is weighted by how little it may ripple.
+        self.weights = [1 / pass_ripple if gain else 1 / stop_ripple for gain in gains]
+        self.window = None
+        self.antisymmetric = False
+        self.algorithm = None
+
+        # Even lengths are zero at nyquist, which the passband may include.
+        step = 2 if gains[-1] else 1
+        estimate = (-20 * np.log10(np.sqrt(pass_ripple * stop_ripple)) - 13) / (14.6 * width) + 1
+        meets_spec = partial(_remez_meets_spec, self.sample_rate, self.filter_kind,
+                             dict(parameters), self.freqs, self.gains, self.weights, maxiter)
+
+        jobs = jobs or os.cpu_count() or 1
+        if jobs == 1:
+            self.taps = _shortest_length(None, meets_spec, estimate, step, max_taps, 1)
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                self.taps = _shortest_length(pool, meets_spec, estimate, step, max_taps, jobs)
+        self.design(maxiter)
+
     def design(self, maxiter=25):
         """ Designs the FIR filter specified.
             for Remez (i.e. window = None), you can
-            give the maximum of iterations allowed. """
-        if self.window:
+            give the maximum of iterations allowed.
+            With algorithm = 'least_squares', the design is
+            by weighted least squares instead. """
+        self._memoize(self.design_cache, (self.get_spec(), maxiter),
+                      lambda: self._design(maxiter), 'design')
+        self.reset()
+
+    def _design(self, maxiter=25):
+        if self.algorithm == 'least_squares':
+            self._design_least_squares()
+        elif self.window:
             print("Window = ", self.window, ", designing using window")
             self._design_window()
         else:
             print("No window, designing with Remez/Parks-McClellan algorithm...")
             self._design_remez(maxiter)
 
+    def get_spec(self):
+        """ Returns the FilterSpec of this filter as it is now. A FIR
+            design is given by its taps, bands and window, not by
+            attenuations, so those go in the options. """
+        options = (('taps', self.taps), ('freqs', freeze(self.freqs)),
+                   ('gains', freeze(getattr(self, 'gains', None))),
+                   ('window', freeze(self.window)), ('weights', freeze(self.weights)),
+                   ('antisymmetric', self.antisymmetric), ('algorithm', self.algorithm))
+        return FilterSpec(family='digital.' + type(self).__name__, kind=self.filter_kind,
+                          passband_frequency=None, stopband_frequency=None,
+                          passband_attenuation=None, stopband_attenuation=None,
+                          ripple=None, sample_rate=freeze(self.sample_rate),
+                          options=options, N=None, Wn=None)
+
     def _design_remez(self, maxiter=25):
             print("Taps = ", self.taps)
             print("Freqs = ", self.freqs)
             print("Gains = ", self.gains)
             self.B = signal.remez(self.taps, self.freqs,
-                                  self.gains, maxiter=maxiter,
-                                  Hz=self.sample_rate)
+                                  self.gains, weight=self.weights, maxiter=maxiter,
+                                  fs=self.sample_rate)
+
+    def _design_least_squares(self):
+        """ Weighted least squares design, like signal.firls: freqs holds
+            the edges of the bands in pairs, gains the gain at each edge
+            and weights, if given, one weight per band. The normal
+            equations are solved by leastsq: directly for short filters,
+            in O(taps log taps) per iteration for long ones, so tens of
+            thousands of taps are fine. """
+        if len(self.freqs) % 2 or len(self.freqs) != len(self.gains):
+            raise ValueError("Least squares designs need a pair of freqs, and of gains, per band.")
+        if self.antisymmetric:
+            raise ValueError("Least squares designs must be symmetric.")
+        if not self.taps % 2 and self.freqs[-1] == self.sample_rate / 2 and self.gains[-1] != 0:
+            raise ValueError("An even number of taps can not pass the Nyquist frequency.")
+
+        to_w = lambda freq: 2 * pi * float(freq) / self.sample_rate
+        bands = [(to_w(start), to_w(stop)) for start, stop in zip(self.freqs[::2], self.freqs[1::2])]
+        desired = list(zip(self.gains[::2], self.gains[1::2]))
+        weights = self.weights if self.weights is not None else [1.0] * len(bands)
+
+        column, hankel, rhs = leastsq.normal_equations(self.taps, bands, desired, weights)
+        half = leastsq.solve_toeplitz_hankel(column, hankel, rhs) / 2
+        if self.taps % 2:
+            self.B = np.concatenate((half[:0:-1], [2 * half[0]], half[1:]))
+        else:
+            self.B = np.concatenate((half[::-1], half))
 
     def _design_window(self):
         self._nyquist = self.sample_rate / 2
@@ -107,22 +447,280 @@ class FIRFilter(Filter):
         print("freqs vector became ", self.freqs)
         print("gains vector became ", self.gains)
 
+        if (self.taps >= LARGE_FIR_TAPS or self.algorithm == 'kaiser') and \
+           len(self.freqs) == len(self.gains):
+            bands = self._step_passbands()
+            if bands is not None:
+                self.B = self._design_closed_form(bands)
+            else:
+                self.B = self._design_frequency_sampling()
+            return
+
+        # The window comes from the cache; firwin2 only samples the gains.
         self.B = signal.firwin2(self.taps, self.freqs, self.gains,
-                                window=self.window, nyq=self._nyquist,
+                                window=None, fs=self.sample_rate,
                                 antisymmetric=self.antisymmetric)
+        self.B *= self.get_window(self.window, self.taps)
+
+    def _step_passbands(self):
+        """ If the gains are only 0 and 1, changing at repeated frequencies
+            (steps, not slopes), returns the bands of gain 1 as (start, stop)
+            pairs, 1 being the Nyquist frequency. Otherwise, None. """
+        if self.antisymmetric or any(gain not in (0, 1) for gain in self.gains):
+            return None
+
+        bands = []
+        for idx in range(len(self.freqs) - 1):
+            start, stop = self.freqs[idx], self.freqs[idx + 1]
+            if start == stop:
+                continue  # The step itself.
+            if self.gains[idx] != self.gains[idx + 1]:
+                return None  # A slope, which only firwin2 does.
+            if self.gains[idx] == 1:
+                start, stop = start / self._nyquist, stop / self._nyquist
+                if bands and bands[-1][1] == start:
+                    bands[-1] = (bands[-1][0], stop)
+                else:
+                    bands.append((start, stop))
+        return bands
+
+    def _design_closed_form(self, bands):
+        """ The windowed ideal response of the bands, as firwin (without
+            scaling) gives it: a sum of sincs, O(taps). """
+        delay = np.arange(self.taps) - (self.taps - 1) / 2
+        B = np.zeros(self.taps)
+        for start, stop in bands:
+            B += stop * np.sinc(stop * delay)
+            if start > 0:
+                B -= start * np.sinc(start * delay)
+        return B * self.get_window(self.window, self.taps)
+
+    def _design_frequency_sampling(self):
+        """ What firwin2 does -- sampling the gains on a power-of-two
+            grid and one inverse real FFT -- but with the window and the
+            linear-phase ramp cached for the number of taps. """
+        points = 1 + 2 ** int(ceil(np.log2(self.taps)))
+        freqs = np.array(self.freqs)
+        eps = np.finfo(float).eps * self._nyquist
+        for idx in range(len(freqs) - 1):
+            if freqs[idx] == freqs[idx + 1]:  # Make steps steep slopes.
+                freqs[idx] -= eps
+                freqs[idx + 1] += eps
+
+        gains = np.interp(np.linspace(0, self._nyquist, points), freqs, self.gains)
+        ramp = self.window_cache.get(('ramp', self.taps, points, self.antisymmetric))
+        if ramp is None:
+            ramp = np.exp(-(self.taps - 1) / 2 * 1j * pi * np.linspace(0, 1, points))
+            if self.antisymmetric:
+                ramp = ramp * 1j
+            ramp.setflags(write=False)
+            self.window_cache.put(('ramp', self.taps, points, self.antisymmetric), ramp)
+
+        B = fft.irfft(gains * ramp)[:self.taps] * self.get_window(self.window, self.taps)
+        if self.get_filter_type() == 3:
+            B[self.taps // 2] = 0.0
+        return B
+
+    @classmethod
+    def get_window(cls, window, taps):
+        """ The window (a name, a (name, parameters...) tuple, or the
+            beta of a Kaiser window, as signal.get_window takes it) of taps
+            points, computed once and then shared, read-only, from
+            window_cache. """
+        if isinstance(window, (int, float, np.number)):
+            window = ('kaiser', float(window))
+        if isinstance(window, str):
+            key = ('window', window, taps, ())
+        else:
+            key = ('window', window[0], taps, tuple(float(value) for value in window[1:]))
+        array = cls.window_cache.get(key)
+        if array is None:
+            array = signal.get_window(window, taps, fftbins=False)
+            array.setflags(write=False)
+            cls.window_cache.put(key, array)
+        return array
+
+    @classmethod
+    def prewarm_windows(cls, windows=PREWARM_WINDOWS, sizes=PREWARM_SIZES):
+        """ Computes the windows of every kind in windows and every length
+            in sizes ahead of time, e.g. while a program starts. """
+        for window in windows:
+            for taps in sizes:
+                cls.get_window(window, taps)
+
+    def _initial_state(self, channels):
+        # lfilter's zi: the (taps - 1) outputs still owed by the past input.
+        if self.B is None:
+            raise ValueError("Design the filter before processing data.")
+        return np.zeros(channels + (len(self.B) - 1,), np.result_type(self.B, float))
+
+    def _filter_block(self, block):
+        nfft = self._pick_fft_size(block.shape[-1])
+        if not nfft:
+            output, final_state = signal.lfilter(self.B, 1.0, block, axis=-1,
+                                                 zi=self._state)
+            self._state[...] = final_state
+            return output
+
+        # The full convolution of the block, plus what the past owed.
+        length, owed = block.shape[-1], self._state.shape[-1]
+        full = self._overlap_save(block, nfft)
+        full[..., :owed] += self._state
+        self._state[...] = full[..., length:]
+        return full[..., :length]
+
+    def _pick_fft_size(self, block_length):
+        """ Picks the FFT size that filters block_length samples with the
+            least work, or returns None when direct convolution is cheaper. """
+        taps = len(self.B)
+        direct_cost = taps * block_length  # lfilter, carrying zi.
+        best_size, best_cost = None, direct_cost
+
+        # The FFTs must also give the (taps - 1) outputs owed to the next block.
+        outputs = block_length + taps - 1
+        nfft = 2 ** int(np.ceil(np.log2(2 * taps)))
+        largest = max(nfft, 2 ** int(np.ceil(np.log2(outputs))))
+        while nfft <= largest:
+            segments = -(-outputs // (nfft - taps + 1))
+            cost = FFT_COST_RATIO * segments * nfft * np.log2(nfft)
+            if cost < best_cost:
+                best_size, best_cost = nfft, cost
+            nfft = nfft * 2
+        return best_size
+
+    def _coefficient_spectrum(self, nfft, onesided=True):
+        """ The rfft (or, for complex data, fft) of the coefficients,
+            cached per FFT size. """
+        if self._spectra_B is not self.B:
+            self._spectra, self._spectra_B = {}, self.B
+        if (nfft, onesided) not in self._spectra:
+            transform = fft.rfft if onesided else fft.fft
+            self._spectra[nfft, onesided] = transform(self.B, nfft)
+        return self._spectra[nfft, onesided]
+
+    def _overlap_save(self, block, nfft):
+        """ Overlap-save convolution of the block with the coefficients,
+            as if zeros came before and after it: returns all the
+            (length + taps - 1) outputs. """
+        taps = len(self.B)
+        step = nfft - taps + 1
+        outputs = block.shape[-1] + taps - 1
+        segments = -(-outputs // step)
+
+        padding = (segments - 1) * step + nfft - block.shape[-1] - (taps - 1)
+        padded = np.pad(block, [(0, 0)] * (block.ndim - 1) + [(taps - 1, padding)])
+        frames = np.lib.stride_tricks.sliding_window_view(padded, nfft, axis=-1)[..., ::step, :]
+
+        onesided = not (np.iscomplexobj(block) or np.iscomplexobj(self.B))
+        if onesided:
+            spectra = fft.rfft(frames, axis=-1) * self._coefficient_spectrum(nfft)
+            output = fft.irfft(spectra, nfft, axis=-1)[..., taps - 1:]
+        else:
+            spectra = fft.fft(frames, axis=-1) * self._coefficient_spectrum(nfft, False)
+            output = fft.ifft(spectra, nfft, axis=-1)[..., taps - 1:]
+        output = output.reshape(output.shape[:-2] + (-1,))
+        return output[..., :outputs]
+
+
+def _remez_meets_spec(sample_rate, kind, parameters, freqs, gains, weights, maxiter, taps):
+    """ Designs a Remez filter of the given taps (in a worker process,
+        for FIRFilter.compute_remez_parameters) and tells whether it
+        meets the spec. Designs that did not converge fail the check. """
+    fir = FIRFilter(sample_rate, taps, list(freqs), list(gains))
+    fir.weights = weights
+    fir.filter_kind = kind
+    fir.filter_parameters = parameters
+    try:
+        fir._design_remez(maxiter)
+    except ValueError:  # remez failed to converge.
+        return False
+    passed, _ = fir.verify()
+    return passed
+
+
+def _tried_lengths(pool, meets_spec, lengths):
+    """ Yields (taps, passed) for each of the lengths, as they finish.
+        Lengths not yet started are dropped if the caller stops early. """
+    if pool is None:
+        for taps in lengths:
+            yield taps, meets_spec(taps)
+        return
+    futures = {pool.submit(meets_spec, taps): taps for taps in lengths}
+    try:
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def _shortest_length(pool, meets_spec, estimate, step, max_taps, count):
+    """ The shortest length (odd, if step is 2) that meets_spec, trying
+        count lengths per round around the estimate. """
+    fit = lambda taps: int(taps) | 1 if step == 2 else max(int(taps), 1)
+    top = max_taps if fit(max_taps) == max_taps else max_taps - 1
+    failed, shortest_passed = set(), None
+    # Only the failures below the shortest pass bound the search; below
+    # the shortest length there is (1 - step), which never passes.
+    longest_failed = lambda: max([taps for taps in failed
+                                  if shortest_passed is None or taps < shortest_passed],
+                                 default=1 - step)
+    guess = fit(max(0.8 * estimate, step))
+
+    while shortest_passed is None or shortest_passed - longest_failed() > step:
+        if shortest_passed is None:
+            if longest_failed() >= top:
+                raise ValueError("No design of up to {} taps meets the spec.".format(max_taps))
+            # Still bracketing: lengths growing by 10% from the guess.
+            lengths = sorted({min(fit(guess * 1.1 ** idx) + step * idx, top)
+                              for idx in range(count)})
+        else:
+            # Narrowing: lengths spread evenly inside the bracket.
+            inside = range(longest_failed() + step, shortest_passed, step)
+            lengths = sorted({inside[(idx + 1) * len(inside) // (count + 1)]
+                              for idx in range(count)})
+
+        for taps, passed in _tried_lengths(pool, meets_spec, lengths):
+            if passed:
+                shortest_passed = min(taps, shortest_passed or taps)
+            else:
+                failed.add(taps)
+            if shortest_passed is not None and shortest_passed - longest_failed() <= step:
+                break
+        # Onwards from the longest length tried, by one step at least.
+        guess = max(max(lengths) * 1.1, max(lengths) + step)
+
+    return shortest_passed
+
 
-class IIRFilter(Filter):
+class IIRFilter(DigitalFilter):
 
     sample_rate = None
     filter_type = None
     already_normalized_Wn = False
 
     def compute_parameters(self):
-        self._compute_parameters()
+        self._compute_parameters_cached()
 
     def design(self):
-        self._design() # It computes Z, P, K for numerical stability.
+        self._design_cached() # It computes Z, P, K for numerical stability.
         self.B, self.A = signal.zpk2tf(self.Z, self.P, self.K)
+        # B/A is fragile for high orders, so also keep the cascaded
+        # biquads, pairing each pole with its nearest zero.
+        self.SOS = signal.zpk2sos(self.Z, self.P, self.K, pairing='nearest')
+        self.reset()
+
+    def _initial_state(self, channels):
+        # Two delays per second-order section and channel (sosfilt's zi).
+        if self.SOS is None:
+            raise ValueError("Design the filter before processing data.")
+        return np.zeros((len(self.SOS),) + channels + (2,), np.result_type(self.SOS, float))
+
+    def _filter_block(self, block):
+        output, final_state = signal.sosfilt(self.SOS, block, axis=-1,
+                                             zi=self._state)
+        self._state[...] = final_state
+        return output
 
     def _compute_parameters(self):
         raise ValueError("Please override me with your own _compute_parameters function!")
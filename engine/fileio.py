@@ -0,0 +1,216 @@
+#!/usr/bin/python3
+# coding: utf-8
+
+# pyfilter: a Python program for filter synthesis
+# (c) 2015 Renan Birck <renan.ee.ufsm@gmail.com>
+
+""" This module filters recordings stored in files (raw PCM, .npy and
+    WAV) through a designed digital filter. The files are read and
+    written through memory maps, one chunk at a time, so the recordings
+    can be much larger than the RAM. """
+
+import os
+import struct
+import numpy as np
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class RecordingLayout():
+    """ Where the samples are inside a file: the byte offset where
+        they begin, their dtype, and the number of frames and channels.
+        The samples are always interleaved (one frame after the other).
+        zero is the value of silence: 128 for 8-bit WAV, which is unsigned. """
+
+    offset = 0
+    dtype = None
+    frames = 0
+    channels = 1
+    sample_rate = None
+    zero = 0
+
+    def __init__(self, offset, dtype, frames, channels, sample_rate=None, zero=0):
+        self.offset = offset
+        self.dtype = np.dtype(dtype)
+        self.frames = frames
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.zero = zero
+
+    def map(self, file_name, start, stop, mode='r'):
+        """ Maps the frames [start, stop) of the file.
+            The result has shape (frames,) for one channel,
+            (frames, channels) otherwise. """
+        shape = (stop - start,) if self.channels == 1 else (stop - start, self.channels)
+        frame_size = self.dtype.itemsize * self.channels
+        return np.memmap(file_name, dtype=self.dtype, mode=mode,
+                         offset=self.offset + start * frame_size, shape=shape)
+
+
+def read_layout(file_name, dtype=None, channels=1):
+    """ Finds the layout of the samples in the file. The format comes from
+        the extension; anything not .npy or .wav is raw PCM, and then
+        the dtype (and channels, when more than one) must be given. """
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension == '.npy':
+        return _read_npy_layout(file_name)
+    elif extension == '.wav':
+        return _read_wav_layout(file_name)
+
+    if dtype is None:
+        raise ValueError("Raw PCM files need the dtype of the samples.")
+    dtype = np.dtype(dtype)
+    frame_size = dtype.itemsize * channels
+    frames = os.path.getsize(file_name) // frame_size
+    return RecordingLayout(0, dtype, frames, channels)
+
+
+def _read_npy_layout(file_name):
+    with open(file_name, 'rb') as npy_file:
+        version = np.lib.format.read_magic(npy_file)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(npy_file)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(npy_file)
+        offset = npy_file.tell()
+
+    if len(shape) not in (1, 2):
+        raise ValueError(".npy recordings must be (frames,) or (frames, channels).")
+    if fortran_order and len(shape) == 2 and shape[1] > 1:
+        raise ValueError("Fortran-ordered .npy recordings are not supported.")
+    channels = shape[1] if len(shape) == 2 else 1
+    return RecordingLayout(offset, dtype, shape[0], channels)
+
+
+def _read_wav_layout(file_name):
+    with open(file_name, 'rb') as wav_file:
+        riff, _, wave = struct.unpack('<4sI4s', wav_file.read(12))
+        if riff != b'RIFF' or wave != b'WAVE':
+            raise ValueError("{} is not a WAV file.".format(file_name))
+
+        fmt = None
+        while True:
+            header = wav_file.read(8)
+            if len(header) < 8:
+                raise ValueError("WAV file without a data chunk.")
+            chunk_id, chunk_size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ':
+                fmt = wav_file.read(chunk_size)
+                if chunk_size % 2:
+                    wav_file.read(1)
+            elif chunk_id == b'data':
+                offset = wav_file.tell()
+                break
+            else:
+                wav_file.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+    if fmt is None:
+        raise ValueError("WAV file without a fmt chunk.")
+
+    format_tag, channels, sample_rate, _, _, bits = struct.unpack('<HHIIHH', fmt[:16])
+    if format_tag == WAVE_FORMAT_EXTENSIBLE:
+        format_tag = struct.unpack('<H', fmt[24:26])[0]
+
+    if format_tag == WAVE_FORMAT_PCM and bits in (8, 16, 32):
+        dtype = {8: '<u1', 16: '<i2', 32: '<i4'}[bits]
+    elif format_tag == WAVE_FORMAT_IEEE_FLOAT and bits in (32, 64):
+        dtype = {32: '<f4', 64: '<f8'}[bits]
+    else:
+        raise ValueError("Unsupported WAV format: tag {}, {} bits.".format(format_tag, bits))
+
+    frame_size = np.dtype(dtype).itemsize * channels
+    data_size = min(chunk_size, os.path.getsize(file_name) - offset)
+    zero = 128 if dtype == '<u1' else 0
+    return RecordingLayout(offset, dtype, data_size // frame_size, channels, sample_rate, zero)
+
+
+def create_recording(file_name, layout):
+    """ Creates an empty file, with the same format as the given layout,
+        and returns the layout of the samples inside it. """
+    extension = os.path.splitext(file_name)[1].lower()
+    data_size = layout.frames * layout.channels * layout.dtype.itemsize
+
+    if extension == '.npy':
+        shape = (layout.frames,) if layout.channels == 1 else (layout.frames, layout.channels)
+        header = {'descr': np.lib.format.dtype_to_descr(layout.dtype),
+                  'fortran_order': False, 'shape': shape}
+        with open(file_name, 'wb') as npy_file:
+            np.lib.format.write_array_header_2_0(npy_file, header)
+            offset = npy_file.tell()
+            npy_file.truncate(offset + data_size)
+    elif extension == '.wav':
+        if layout.dtype.kind == 'f':
+            format_tag = WAVE_FORMAT_IEEE_FLOAT
+        else:
+            format_tag = WAVE_FORMAT_PCM
+        bits = layout.dtype.itemsize * 8
+        block_align = layout.channels * layout.dtype.itemsize
+        sample_rate = layout.sample_rate or 0
+        pad = data_size % 2  # Chunks take an even number of bytes.
+        with open(file_name, 'wb') as wav_file:
+            wav_file.write(struct.pack('<4sI4s', b'RIFF', 36 + data_size + pad, b'WAVE'))
+            wav_file.write(struct.pack('<4sIHHIIHH', b'fmt ', 16, format_tag,
+                                       layout.channels, sample_rate,
+                                       sample_rate * block_align, block_align, bits))
+            wav_file.write(struct.pack('<4sI', b'data', data_size))
+            offset = wav_file.tell()
+            wav_file.truncate(offset + data_size + pad)
+    else:
+        offset = 0
+        with open(file_name, 'wb') as raw_file:
+            raw_file.truncate(data_size)
+
+    return RecordingLayout(offset, layout.dtype, layout.frames,
+                           layout.channels, layout.sample_rate, layout.zero)
+
+
+def _to_dtype(samples, dtype):
+    """ Converts the filtered samples to the dtype of the file,
+        rounding and clipping when it is an integer type. """
+    if dtype.kind in 'iu':
+        limits = np.iinfo(dtype)
+        samples = np.clip(np.rint(samples), limits.min, limits.max)
+    return samples.astype(dtype)
+
+
+def filter_file(filter_design, source, destination, dtype=None, channels=1,
+                chunk_size=65536):
+    """ Filters the recording in source through filter_design (a designed
+        FIRFilter or IIRFilter) and writes it to destination, in the same
+        format and sample type. Every channel is filtered.
+
+        Only chunk_size frames are mapped at a time, and the filter state
+        carries from one chunk to the next, so the output is the same as
+        filtering the whole recording at once. dtype and channels are
+        only needed for raw PCM sources. Returns the number of frames. """
+    layout = read_layout(source, dtype, channels)
+
+    if layout.sample_rate and filter_design.sample_rate and \
+       layout.sample_rate != filter_design.sample_rate:
+        raise ValueError("The recording is sampled at {} Hz, but the filter "
+                         "was designed for {} Hz.".format(layout.sample_rate,
+                                                          filter_design.sample_rate))
+
+    output_layout = create_recording(destination, layout)
+
+    filter_design.reset()
+    for start in range(0, layout.frames, chunk_size):
+        stop = min(start + chunk_size, layout.frames)
+        chunk_in = layout.map(source, start, stop)
+        chunk_out = output_layout.map(destination, start, stop, mode='r+')
+
+        # (frames, channels) on disk; transposing gives the filter the
+        # (channels, frames) view it wants. The filter works around zero,
+        # so offset samples (8-bit WAV) are centered first.
+        samples = chunk_in.T - float(layout.zero) if layout.zero else chunk_in.T
+        filtered = filter_design.process(samples)
+        chunk_out[...] = _to_dtype(filtered.T + layout.zero, layout.dtype)
+        chunk_out.flush()
+
+        # Drop the maps, so only one chunk is ever resident.
+        del chunk_in, chunk_out
+
+    filter_design.reset()
+    return layout.frames
@@ -1,8 +1,40 @@
 #!/usr/bin/python3
 # coding: utf-8
 
-from math import pi
+from math import pi, ceil
+import hashlib
+from collections import namedtuple
+import numpy as np
 from scipy import signal
+import cache
+import response
+
+# Everything a design depends on, in a hashable (and so cacheable) form.
+# options holds the (name, value) pairs of the design settings that live
+# in the filter object itself (target, ripple, stopband attenuation...).
+FilterSpec = namedtuple('FilterSpec', ['family', 'kind',
+                                       'passband_frequency', 'stopband_frequency',
+                                       'passband_attenuation', 'stopband_attenuation',
+                                       'ripple', 'sample_rate', 'options',
+                                       'N', 'Wn'])
+
+# Attributes of the filter objects that change how they are designed.
+DESIGN_OPTIONS = ('target', 'ripple', 'stopband_attenuation', 'already_normalized_Wn')
+
+# The fewest points Filter.verify() looks at in a band, however narrow.
+MIN_BAND_POINTS = 64
+
+# What a finished design is made of, as stored in the disk cache.
+DESIGN_RESULTS = ('N', 'Wn', 'Z', 'P', 'K', 'B', 'A', 'SOS', 'taps')
+
+def freeze(value):
+    """ Turns lists and arrays into tuples and NumPy scalars into
+        Python numbers, so that the value can be hashed. """
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
 
 class Filter:
     """ Generic class for a filter. This is not called directly,
@@ -17,7 +49,16 @@ class Filter:
     Wn = None
     B, A = None, None  # Filter in B/A mode
     Z, P, K = None, None, None  # Filter in ZPK mode
+    SOS = None  # Filter in second-order sections (cascaded biquads) mode
     W, H = None, None  # Filter's frequencies and values.
+    group_delay, phase_delay = None, None  # Samples (digital) or seconds (analog).
+    use_cache = True  # Memoize compute_parameters() and design()?
+    parameters_cache = cache.parameters_cache
+    design_cache = cache.design_cache
+    response_cache = cache.response_cache  # Memoizes compute_frequencies().
+    disk_cache = None  # Set to a cache.DiskCache to share designs across processes.
+    _assigned = None  # While _memoize runs a step, what the step assigns.
+
     def hz_to_rad(self, x):
         """ Converts X Hz to radians/second. """
         if isinstance(x, list):
@@ -30,9 +71,16 @@ class Filter:
         if parameters:
             self.set_parameters(parameters)
 
+    def __setattr__(self, name, value):
+        # Every assignment counts for _memoize, even of the value already there.
+        if self._assigned is not None:
+            self._assigned[name] = value
+        object.__setattr__(self, name, value)
+
     def set_parameters(self, parameters):
-        """ Configures the parameters and does some validation on them. """
-        self.filter_parameters = parameters
+        """ Configures the parameters and does some validation on them.
+            The dictionary given is copied, not changed. """
+        self.filter_parameters = dict(parameters)
 
         # Convert from Hz to rad/s
         self.filter_parameters['passband_frequency'] = self.hz_to_rad(self.filter_parameters['passband_frequency'])
@@ -72,11 +120,335 @@ class Filter:
                 raise ValueError("All values should be positive!")
             self.filter_kind = filter_kind(pb, None, sb, None)
 
-    def compute_frequencies(self, N=None):
-        if hasattr(self, 'sample_rate'):
+    def get_spec(self):
+        """ Returns the FilterSpec of this filter as it is now. """
+        parameters = self.filter_parameters
+        ripple = getattr(self, 'ripple', None) or parameters.get('ripple')
+        options = tuple((name, freeze(getattr(self, name)))
+                        for name in DESIGN_OPTIONS if hasattr(self, name))
+        family = type(self).__module__.rsplit('.', 1)[-1] + '.' + type(self).__name__
+
+        return FilterSpec(family=family, kind=self.filter_kind,
+                          passband_frequency=freeze(parameters.get('passband_frequency')),
+                          stopband_frequency=freeze(parameters.get('stopband_frequency')),
+                          passband_attenuation=freeze(parameters.get('passband_attenuation')),
+                          stopband_attenuation=freeze(parameters.get('stopband_attenuation')),
+                          ripple=freeze(ripple),
+                          sample_rate=freeze(getattr(self, 'sample_rate', None)),
+                          options=options, N=freeze(self.N), Wn=freeze(self.Wn))
+
+    def _memoize(self, lru, key, function, tag):
+        """ Calls function (which sets attributes of this filter) unless
+            the cache already knows what it sets for key; then those
+            attributes are just restored. Looks in the memory cache lru
+            first, then in the disk cache (under tag and key). """
+        if not self.use_cache:
+            function()
+            return
+
+        changes = lru.get(key)
+        if changes is None and self.disk_cache is not None:
+            changes = self._load_changes((tag, key))
+
+        if changes is None:
+            outer = self._assigned
+            object.__setattr__(self, '_assigned', {})
             try:
-                self.W, self.H = signal.freqz(self.B, self.A)
-            except:
-                self.W, self.H = signal.freqz(self.B)
+                function()
+            finally:
+                changes = self._assigned
+                object.__setattr__(self, '_assigned', outer)
+            # Keep the final values, even of what was changed in place.
+            changes = {name: getattr(self, name) for name in changes}
+            for value in changes.values():
+                if isinstance(value, np.ndarray):
+                    value.setflags(write=False)  # It is shared now.
+            if self.disk_cache is not None:
+                self._store_changes((tag, key), changes)
+
+        lru.put(key, changes)
+        for name, value in changes.items():
+            setattr(self, name, value)  # So that an outer _memoize sees them too.
+
+    def _load_changes(self, key):
+        stored = self.disk_cache.get(key)
+        if stored is None:
+            return None
+        changes = {}
+        for name, value in stored.items():
+            value.setflags(write=False)
+            changes[name] = value.item() if value.ndim == 0 else value
+        return changes
+
+    def _store_changes(self, key, changes):
+        """ Saves the part of changes that makes up the design. """
+        results = {name: value for name, value in changes.items()
+                   if name in DESIGN_RESULTS + DESIGN_OPTIONS and value is not None}
+        self.disk_cache.put(key, results)
+
+    def _compute_parameters_cached(self):
+        key = self.get_spec()._replace(N=None, Wn=None)
+        self._memoize(self.parameters_cache, key, self._compute_parameters,
+                      'parameters')
+
+    def _design_cached(self):
+        self._memoize(self.design_cache, self.get_spec(), self._design, 'design')
+
+    def _coefficients_digest(self):
+        """ A hash of the coefficients, which is what the response depends on. """
+        digest = hashlib.sha256()
+        for coefficients in (self.B, self.A, self.SOS, self.Z, self.P, self.K):
+            if coefficients is not None:
+                digest.update(np.ascontiguousarray(coefficients, dtype=complex).tobytes())
+            digest.update(b'|')
+        return digest.hexdigest()
+
+    def compute_frequencies(self, N=None, grid=None):
+        """ Computes the frequency response, in W (radians/sample for
+            digital filters, radians/second for analog ones) and H.
+            Either N points are chosen by SciPy, or they are given by
+            grid, a response.FrequencyGrid.
+
+            The result is memoized in response_cache (and disk_cache, if
+            any) under a hash of the coefficients, so a new design is
+            never answered with an old response. W and H are read-only. """
+        self.W, self.H = self._cached_response('response', ('W', 'H'), N, grid,
+                                               lambda: self._compute_frequencies(N, grid))
+
+    def compute_delays(self, N=None, grid=None):
+        """ Computes the response (as compute_frequencies() does) and the
+            group and phase delays on the same points, from the zeros and
+            poles: in samples for digital filters, in seconds for analog
+            ones. They are memoized with the response. """
+        self.compute_frequencies(N, grid)
+        self.group_delay, self.phase_delay = self._cached_response(
+            'delays', ('group_delay', 'phase_delay'), N, grid, self._compute_delays)
+
+    def _cached_response(self, what, names, N, grid, compute):
+        """ Returns the arrays compute() returns, memoizing them under
+            what, N, grid and the coefficients; names are for the disk. """
+        if not self.use_cache:
+            return compute()
+
+        grid_key = grid.key if grid is not None else None
+        key = (what, N, grid_key, self._coefficients_digest(),
+               getattr(self, 'sample_rate', 'analog'))
+        stored = self.response_cache.get(key)
+        if stored is None and self.disk_cache is not None:
+            stored = self.disk_cache.get(key)
+            if stored is not None:
+                stored = tuple(stored[name] for name in names)
+                for array in stored:
+                    array.setflags(write=False)
+        if stored is None:
+            stored = tuple(np.array(array) for array in compute())
+            for array in stored:
+                array.setflags(write=False)
+            if self.disk_cache is not None:
+                self.disk_cache.put(key, dict(zip(names, stored)))
+
+        self.response_cache.put(key, stored)
+        return stored
+
+    def _compute_frequencies(self, N=None, grid=None):
+        if hasattr(self, 'sample_rate'):
+            if grid is not None:
+                W = grid.angular(self.sample_rate)
+            else:
+                N = N if N else 512
+                W = np.arange(N) * (pi / N)  # As freqz chooses them.
+        else:
+            if grid is not None:
+                W = grid.angular()
+            elif self.Z is not None:
+                W = signal.findfreqs(self.Z, self.P, N if N else 200, kind='zp')
+            else:
+                W = signal.findfreqs(self.B, self.A, N if N else 200)
+        return W, self.evaluate(W)
+
+    def _compute_delays(self):
+        group_delay = self.evaluate_group_delay(self.W)
+        start = self._phase_at(self.W[0]) if len(self.W) and self.W[0] > 0 else None
+        return group_delay, response.phase_delay(self.W, self.H, group_delay, start)
+
+    def _phase_at(self, W, points=64, max_points=1 << 16):
+        """ The phase at W, unwrapped from W = 0 on a grid fine enough
+            that the group delay predicts every step within pi / 4. """
+        while True:
+            grid = np.linspace(0, W, points)
+            group_delay = self.evaluate_group_delay(grid)
+            steps = np.diff(grid) * (group_delay[:-1] + group_delay[1:]) / 2
+            largest = np.max(np.abs(steps[np.isfinite(steps)]), initial=0.0)
+            if largest <= pi / 4 or points >= max_points:
+                break
+            points = min(max_points, int(points * 4 * largest / pi) + 1)
+        return response.unwrapped_phase(grid, self.evaluate(grid), group_delay)[-1]
+
+    def evaluate_group_delay(self, W):
+        """ Returns the group delay at the angular frequencies W, from the
+            zeros and poles when there are any. Otherwise, the second-order
+            sections or B/A give it as Re(D(n b) / D(b)), D being their
+            transform, which needs no roots: the way for long FIR filters. """
+        W = np.asarray(W, dtype=float)
+        analog = not hasattr(self, 'sample_rate')
+        if self.Z is not None and self.P is not None:
+            return response.zpk_group_delay(self.Z, self.P, W, analog)
+        if analog:
+            return response.zpk_group_delay(np.roots(self.B), np.roots(self.A), W, True)
+        if self.SOS is not None:
+            return (response.polynomial_group_delay(self.SOS[:, :3], W).sum(axis=0) -
+                    response.polynomial_group_delay(self.SOS[:, 3:], W).sum(axis=0))
+        delay = response.polynomial_group_delay(self.B, W)[0]
+        if self.A is not None and np.size(self.A) > 1:
+            delay = delay - response.polynomial_group_delay(self.A, W)[0]
+        return delay
+
+    def evaluate(self, W):
+        """ Returns H at the angular frequencies W (radians/sample for
+            digital filters, radians/second for analog ones). The zeros
+            and poles are used when there are any, then the second-order
+            sections; only when there is neither, the B/A polynomials. """
+        W = np.asarray(W, dtype=float)
+        analog = not hasattr(self, 'sample_rate')
+        if self.Z is not None and self.P is not None:
+            return response.zpk_response(self.Z, self.P, self.K, W, analog)
+        if analog:
+            return signal.freqs(self.B, self.A, W)[1]
+        if self.SOS is not None:
+            return response.sos_response(self.SOS, W)
+        try:
+            return signal.freqz(self.B, self.A, worN=W)[1]
+        except:
+            return signal.freqz(self.B, worN=W)[1]
+
+    def band_edges(self):
+        """ The bands of the spec in filter_parameters, as a list of
+            (kind, start, stop), kind being 'pass' or 'stop' and the edges
+            in the units of W. Digital bands end at pi; analog ones, having
+            no end, are taken up to 10 times the highest edge. """
+        passband = self.filter_parameters['passband_frequency']
+        stopband = self.filter_parameters['stopband_frequency']
+        if hasattr(self, 'sample_rate'):
+            to_w = lambda x: min(x / self.sample_rate, pi)
+            top = pi
         else:
-            self.W, self.H = signal.freqs(self.B, self.A, N)
+            to_w = lambda x: x
+            top = 10 * max(np.max(passband), np.max(stopband))
+
+        if self.filter_kind == 'lowpass':
+            return [('pass', 0.0, to_w(passband)), ('stop', to_w(stopband), top)]
+        elif self.filter_kind == 'highpass':
+            return [('stop', 0.0, to_w(stopband)), ('pass', to_w(passband), top)]
+        elif self.filter_kind == 'bandpass':
+            return [('stop', 0.0, to_w(stopband[0])),
+                    ('pass', to_w(passband[0]), to_w(passband[1])),
+                    ('stop', to_w(stopband[1]), top)]
+        elif self.filter_kind == 'bandstop':
+            return [('pass', 0.0, to_w(passband[0])),
+                    ('stop', to_w(stopband[0]), to_w(stopband[1])),
+                    ('pass', to_w(passband[1]), top)]
+        raise ValueError("There are no bands in a(n) {} filter.".format(self.filter_kind))
+
+    def verify(self, N=None, slack=1e-6, early_exit=True):
+        """ Checks that the design meets passband_attenuation and
+            stopband_attenuation of filter_parameters. The response is
+            evaluated on the band edges first, where most designs fail
+            (with early_exit, it stops there if one is more than slack dB
+            off the spec), then on a grid as dense as N points from 0 to
+            the last edge, with at least MIN_BAND_POINTS in each band,
+            however narrow. If N is None, it follows the order of the
+            filter: some 16 points per ripple.
+
+            Each band grid takes one pass: a chirp-Z transform for FIR
+            filters, the factored response for zeros and poles.
+
+            Returns (passed, margins), margins holding a response.BandMargin
+            per band -- of the edges only, if it stopped there. """
+        limits = {'pass': self.filter_parameters.get('passband_attenuation'),
+                  'stop': self.filter_parameters.get('stopband_attenuation')}
+        bands = [(kind, start, stop) for kind, start, stop in self.band_edges()
+                 if limits[kind] is not None]
+        if not bands:
+            raise ValueError("There is no attenuation in the spec to verify.")
+
+        kinds = [kind for kind, _, _ in bands]
+        starts = np.array([start for _, start, _ in bands])
+        stops = np.array([stop for _, _, stop in bands])
+        limits = np.array([-limits[kind] for kind in kinds], dtype=float)
+        # margin = sign * (dB - limit): passbands must be above, stopbands below.
+        signs = np.array([1.0 if kind == 'pass' else -1.0 for kind in kinds])
+
+        # The edges first: (len(bands) x 2) points.
+        edges = np.stack((starts, stops), axis=1)
+        edge_margins = signs[:, np.newaxis] * (self._magnitude_db(edges) - limits[:, np.newaxis])
+        corner = np.argmin(edge_margins, axis=1)
+        worst = edge_margins[np.arange(len(bands)), corner]
+        worst_W = edges[np.arange(len(bands)), corner]
+
+        if not (early_exit and np.any(worst < -slack)):
+            if N is None:
+                # An order n response ripples up to n times.
+                N = max(512, 16 * self._response_order())
+            density = N / np.max(stops)
+            for idx in range(len(bands)):
+                count = max(MIN_BAND_POINTS, int(ceil(density * (stops[idx] - starts[idx]))))
+                W, db = self._band_db(starts[idx], stops[idx], count)
+                margins = signs[idx] * (db - limits[idx])
+                lowest = np.argmin(margins)
+                if margins[lowest] < worst[idx]:
+                    worst[idx], worst_W[idx] = margins[lowest], W[lowest]
+
+        worst_db = limits + worst * signs
+        passed = bool(np.all(worst >= -slack))
+        return passed, [response.BandMargin(kinds[idx], float(starts[idx]), float(stops[idx]),
+                                            float(limits[idx]),
+                                            (float(worst_W[idx]), float(worst_db[idx])),
+                                            float(worst[idx]))
+                        for idx in range(len(bands))]
+
+    def _magnitude_db(self, W):
+        """ |H| in dB at W; from the logarithm of the factored response
+            when there are zeros and poles, so no point overflows. """
+        if self.Z is not None and self.P is not None:
+            log_H = response.zpk_log_magnitude(self.Z, self.P, self.K, W,
+                                               not hasattr(self, 'sample_rate'))
+            return 20 / np.log(10) * log_H
+        return response.magnitude_db(self.evaluate(W))
+
+    def _band_db(self, start, stop, count):
+        """ (W, |H| in dB) on count points from start to stop, both included. """
+        W = np.linspace(start, stop, count)
+        fir = hasattr(self, 'sample_rate') and self.Z is None and self.SOS is None and \
+            self.B is not None and (self.A is None or np.size(self.A) == 1)
+        if fir and stop > start:
+            zoom = signal.ZoomFFT(np.size(self.B), [start, stop], count, fs=2 * pi,
+                                  endpoint=True)
+            H = zoom(np.atleast_1d(self.B))
+            if self.A is not None:
+                H = H / np.ravel(self.A)[0]
+            return W, response.magnitude_db(H)
+        return W, self._magnitude_db(W)
+
+    def _response_order(self):
+        """ The order of the designed response: the degree of B or A, or
+            of the sections, or the number of zeros or poles. """
+        if self.B is not None:
+            A = self.A if self.A is not None else [1.0]
+            return max(np.size(self.B), np.size(A)) - 1
+        if self.SOS is not None:
+            return 2 * len(self.SOS)
+        if self.P is not None:
+            return max(np.size(self.P), np.size(self.Z))
+        return self.N or 0
+
+    def adaptive_response(self, points=16, tolerance=0.1, max_depth=8, polish=3):
+        """ Evaluates the response on each band of the spec, refining the
+            grid only where the magnitude bends, or is near the limits of
+            filter_parameters (see response.adaptive_response). Returns a
+            response.AdaptiveResponse, with the extrema of every band. """
+        limits = {'pass': self.filter_parameters.get('passband_attenuation'),
+                  'stop': self.filter_parameters.get('stopband_attenuation')}
+        bands = [(kind, start, stop, -limits[kind] if limits[kind] is not None else None)
+                 for kind, start, stop in self.band_edges()]
+        return response.adaptive_response(self.evaluate, bands, points,
+                                          tolerance, max_depth, polish)
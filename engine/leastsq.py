@@ -0,0 +1,170 @@
+#!/usr/bin/python3
+# coding: utf-8
+
+# pyfilter: a Python program for filter synthesis
+# (c) 2015 Renan Birck <renan.ee.ufsm@gmail.com>
+
+""" This module designs linear phase FIR filters by weighted least
+    squares. The normal equations of such a design are a Toeplitz plus
+    Hankel system; small ones are solved as a dense matrix, like
+    signal.firls does, but instead of doing that in O(N^3) for large
+    ones, they are solved by conjugate gradients, every product being a
+    few FFTs, so designs of many thousands of taps are cheap. """
+
+import warnings
+import numpy as np
+from scipy import fft, linalg
+
+# Systems up to this size are solved directly: in a few milliseconds,
+# and exactly even when they are nearly singular.
+DIRECT_SIZE = 1024
+# Conjugate gradients give up after this many iterations without a better residual.
+STALL_ITERATIONS = 200
+
+
+def _cosine_integral(n, start, stop):
+    """ The integral of cos(n w) from start to stop, for an array n. """
+    return stop * np.sinc(n * stop / np.pi) - start * np.sinc(n * start / np.pi)
+
+
+def _ramp_integral(n, start, stop):
+    """ The integral of (w - start) cos(n w) from start to stop. """
+    safe = np.where(n == 0, 1.0, n)
+    antiderivative = lambda w: w * np.sin(safe * w) / safe + np.cos(safe * w) / safe ** 2
+    integral = antiderivative(stop) - antiderivative(start) - start * _cosine_integral(n, start, stop)
+    return np.where(n == 0, (stop - start) ** 2 / 2, integral)
+
+
+def normal_equations(taps, bands, desired, weights):
+    """ The normal equations of the least squares design of a symmetric
+        filter of taps coefficients. bands holds the edges of each band in
+        rad/sample, as (start, stop) pairs; desired, the gains at those
+        edges (linear in between); weights, one per band. The amplitude
+        is the sum of a[k] cos((k + s) w), s being 0 for odd taps and 1/2
+        for even ones.
+
+        Returns (column, hankel, rhs): the system is (T + H) a = rhs, T
+        being the symmetric Toeplitz matrix with the first column given,
+        and H the Hankel one with H[k, l] = hankel[k + l]. """
+    size = (taps + 1) // 2
+    shift = 0.0 if taps % 2 else 0.5
+    orders = np.arange(2 * size + 1, dtype=float)
+    frequencies = np.arange(size) + shift
+
+    moments = np.zeros(len(orders))
+    rhs = np.zeros(size)
+    for (start, stop), (first, last), weight in zip(bands, desired, weights):
+        moments += weight * _cosine_integral(orders, start, stop)
+        slope = (last - first) / (stop - start) if stop > start else 0.0
+        rhs += weight * (first * _cosine_integral(frequencies, start, stop) +
+                         slope * _ramp_integral(frequencies, start, stop))
+
+    # cos(a w) cos(b w) = (cos((a - b) w) + cos((a + b) w)) / 2.
+    column = moments[:size] / 2
+    hankel = moments[int(2 * shift):int(2 * shift) + 2 * size - 1] / 2
+    return column, hankel, rhs
+
+
+def toeplitz_hankel_matvec(column, hankel):
+    """ Returns a function computing (T + H) x, as in normal_equations,
+        with FFTs: O(N log N) instead of O(N^2). """
+    size = len(column)
+    nfft = fft.next_fast_len(3 * size - 2, real=True)
+    # The circulant that embeds T, and the spectrum of the Hankel diagonals.
+    circulant = np.concatenate((column, np.zeros(nfft - 2 * size + 1), column[:0:-1]))
+    toeplitz_spectrum = fft.rfft(circulant, nfft)
+    hankel_spectrum = fft.rfft(hankel, nfft)
+
+    def matvec(x):
+        toeplitz = fft.irfft(toeplitz_spectrum * fft.rfft(x, nfft), nfft)[:size]
+        # (H x)[k] = sum of hankel[k + l] x[l]: a convolution with x reversed.
+        flipped = fft.irfft(hankel_spectrum * fft.rfft(x[::-1], nfft), nfft)
+        return toeplitz + flipped[size - 1:2 * size - 1]
+
+    return matvec
+
+
+def solve_toeplitz_hankel(column, hankel, rhs, tolerance=1e-14, maxiter=2000, ridge=0.0,
+                          direct_size=DIRECT_SIZE):
+    """ Solves (T + H) x = rhs, as in normal_equations, for a positive
+        definite T + H. Up to direct_size unknowns, by Cholesky (or least
+        squares, when the system is too ill-conditioned for it); beyond,
+        by conjugate gradients, preconditioned by T. Chan's circulant
+        approximation of T, inverted with FFTs too. Those stop when the
+        residual is tolerance times that of x = 0; if that takes more
+        than maxiter iterations, or the residual has not improved in the
+        last STALL_ITERATIONS, it warns and returns the best x it found.
+        With maxiter bounded, the cost is O(N log N), whatever N.
+
+        The tolerance must be near round-off: the error in the bands
+        comes from the components of the residual along the smallest
+        eigenvalues, and these are some 1e-13 of the largest when the
+        transition bands are narrow. At 1e-9, a 1001 tap lowpass has its
+        stopband at -77 dB instead of -140 dB.
+
+        Bands that leave much of 0..pi out (transition bands far wider
+        than the length needs) make the system nearly singular: conjugate
+        gradients stall on it, and any x that fits the bands about as well
+        may come out. ridge adds
+        that fraction of the mean diagonal to the diagonal, which picks
+        the smallest such x and makes the system well-conditioned. """
+    size = len(column)
+    if ridge:
+        column = np.array(column, dtype=float)
+        column[0] += ridge * (column[0] + np.mean(hankel[::2]))
+    if size <= direct_size:
+        return _solve_dense(column, hankel, rhs)
+    matvec = toeplitz_hankel_matvec(column, hankel)
+
+    # The circulant closest to T (in the Frobenius norm), by its eigenvalues.
+    lags = np.arange(size)
+    chan = ((size - lags) * column + lags * column[(size - lags) % size]) / size
+    eigenvalues = fft.rfft(chan)
+    # The symbol of T vanishes in the bands that do not count; a floor
+    # keeps the preconditioner from blowing up there.
+    eigenvalues = np.maximum(eigenvalues.real, 1e-6 * np.max(np.abs(eigenvalues)))
+    precondition = lambda r: fft.irfft(fft.rfft(r) / eigenvalues, size)
+
+    x = np.zeros(size)
+    residual = np.array(rhs, dtype=float)
+    goal = tolerance * np.linalg.norm(residual)
+    best, best_x, since_best = np.linalg.norm(residual), x.copy(), 0
+    z = precondition(residual)
+    direction = z.copy()
+    rz = residual @ z
+    for iteration in range(maxiter):
+        if best <= goal or since_best >= STALL_ITERATIONS:
+            break
+        product = matvec(direction)
+        step = rz / (direction @ product)
+        x += step * direction
+        residual -= step * product
+        z = precondition(residual)
+        rz, previous = residual @ z, rz
+        direction = z + (rz / previous) * direction
+
+        # In floating point the residual of a nearly singular system goes
+        # up and down; the best x so far is kept.
+        if np.linalg.norm(residual) < best:
+            best, best_x, since_best = np.linalg.norm(residual), x.copy(), 0
+        else:
+            since_best += 1
+    if best > goal:
+        warnings.warn("Least squares solver stopped after {} iterations with a relative "
+                      "residual of {:.1e}, above {:.1e}.".format(
+                          iteration + 1, best / np.linalg.norm(rhs), tolerance),
+                      RuntimeWarning)
+    return best_x
+    return x
+
+
+def _solve_dense(column, hankel, rhs):
+    """ (T + H) x = rhs as a dense matrix, the way signal.firls solves it. """
+    size = len(column)
+    matrix = linalg.toeplitz(column) + linalg.hankel(hankel[:size], hankel[size - 1:])
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', linalg.LinAlgWarning)
+            return linalg.solve(matrix, rhs, assume_a='pos', check_finite=False)
+    except (linalg.LinAlgError, linalg.LinAlgWarning):
+        return linalg.lstsq(matrix, rhs, lapack_driver='gelsy')[0]
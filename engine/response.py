@@ -0,0 +1,429 @@
+#!/usr/bin/python3
+# coding: utf-8
+
+# pyfilter: a Python program for filter synthesis
+# (c) 2015 Renan Birck <renan.ee.ufsm@gmail.com>
+
+""" This module has the tools used to evaluate frequency responses. """
+
+import hashlib
+from math import pi
+from collections import namedtuple
+from functools import lru_cache
+import numpy as np
+from scipy import fft
+
+# What adaptive_response() found in one band: its kind ('pass' or 'stop'),
+# its edges, the spec limit in dB (or None), where the magnitude (in dB) is
+# lowest and highest, as (W, dB) pairs, and an (n x 2) array of every
+# local extremum found inside it.
+BandExtrema = namedtuple('BandExtrema', ['kind', 'start', 'stop', 'limit',
+                                         'minimum', 'maximum', 'extrema'])
+AdaptiveResponse = namedtuple('AdaptiveResponse', ['W', 'H', 'bands'])
+
+# What verify() found in one band: its kind, edges and limit (dB), the
+# worst point seen (W, dB), and the margin there, in dB: how far it is
+# from the limit, negative when the spec is not met.
+BandMargin = namedtuple('BandMargin', ['kind', 'start', 'stop', 'limit',
+                                       'worst', 'margin'])
+
+# Below this (in dB, under the band limit) the magnitude is not refined:
+# how deep a stopband notch goes does not matter for the spec.
+REFINE_FLOOR = 20.0
+
+
+class FrequencyGrid():
+    """ The frequencies where a response is evaluated. It can be made of
+        num points, linearly or logarithmically spaced from start to
+        stop, or of any points given. The units can be:
+
+        - 'hz': hertz;
+        - 'rad': radians/second;
+        - 'normalized': digital frequencies, where 1 is the Nyquist frequency.
+
+        The same grid can be used for many filters and many calls: the
+        angular frequencies are computed once per sample rate. """
+
+    start, stop, num = None, None, None
+    scale = None
+    units = None
+    points = None
+    key = None  # Hashable, and equal for grids with the same points.
+
+    def __init__(self, start=None, stop=None, num=512, scale='linear', units='hz',
+                 points=None):
+        if units not in ('hz', 'rad', 'normalized'):
+            raise ValueError("Units must be 'hz', 'rad' or 'normalized'.")
+        if scale not in ('linear', 'log'):
+            raise ValueError("Scale must be 'linear' or 'log'.")
+
+        self.units = units
+        self._angular = {}
+
+        if points is not None:
+            self.points = np.array(points, dtype=float)
+            self.points.setflags(write=False)
+            self.num = len(self.points)
+            digest = hashlib.sha256(self.points.tobytes()).hexdigest()
+            self.key = ('points', units, digest)
+            return
+
+        if scale == 'log' and start is not None and start <= 0:
+            raise ValueError("A log grid must start above zero.")
+        self.start, self.stop, self.num = start, stop, num
+        self.scale = scale
+        self.key = (scale, units, start, stop, num)
+
+    def __repr__(self):
+        return 'FrequencyGrid{}'.format(self.key)
+
+    def frequencies(self, sample_rate=None):
+        """ The points of the grid, in its own units. A grid without a
+            start or stop goes from 0 (or, for log grids, 1/1000 of the
+            stop) to the Nyquist frequency, so it needs the sample rate. """
+        if self.points is not None:
+            return self.points
+
+        nyquist = {'hz': None, 'rad': None, 'normalized': 1.0}[self.units]
+        if sample_rate:
+            nyquist = {'hz': sample_rate / 2, 'rad': pi * sample_rate,
+                       'normalized': 1.0}[self.units]
+
+        stop = self.stop if self.stop is not None else nyquist
+        if stop is None:
+            raise ValueError("This grid needs a stop frequency.")
+        start = self.start
+        if start is None:
+            start = stop / 1000 if self.scale == 'log' else 0.0
+
+        if self.scale == 'log':
+            return np.logspace(np.log10(start), np.log10(stop), self.num)
+        return np.linspace(start, stop, self.num)
+
+    def angular(self, sample_rate=None):
+        """ The points of the grid as angular frequencies: radians/sample
+            for a digital filter (when sample_rate is given), radians/second
+            for an analog one. Computed once per sample rate. """
+        if sample_rate not in self._angular:
+            points = self.frequencies(sample_rate)
+            if sample_rate:
+                scale = {'hz': 2 * pi / sample_rate, 'rad': 1.0 / sample_rate,
+                         'normalized': pi}[self.units]
+            elif self.units == 'normalized':
+                raise ValueError("Normalized frequencies need a sample rate.")
+            else:
+                scale = {'hz': 2 * pi, 'rad': 1.0}[self.units]
+            angular = points * scale
+            angular.setflags(write=False)
+            self._angular[sample_rate] = angular
+        return self._angular[sample_rate]
+
+
+# At most this many (frequency, factor) pairs are evaluated at once.
+FACTOR_CHUNK = 1 << 20
+
+
+def zpk_response(Z, P, K, W, analog=False):
+    """ H at the angular frequencies W, from the zeros, poles and gain
+        (of H(s) if analog, of H(z) otherwise), without expanding them
+        into polynomials. The factors are added up as logarithms, so
+        high orders neither overflow nor lose the small values. """
+    return np.exp(zpk_log_response(Z, P, K, W, analog))
+
+
+def zpk_log_response(Z, P, K, W, analog=False):
+    """ log H at W, as zpk_response() computes it: its real part is
+        ln |H|, its imaginary part the sum of the angles of the factors,
+        which (for roots off the axis) needs no unwrapping. """
+    W = np.asarray(W, dtype=float)
+    Z = np.atleast_1d(np.asarray(Z, dtype=complex))
+    P = np.atleast_1d(np.asarray(P, dtype=complex))
+    points = 1j * W if analog else np.exp(1j * W)
+
+    log_H = np.full(W.shape, np.log(complex(K)) if K != 0 else -np.inf + 0j)
+    if not analog:
+        # H(z) = K z^(len(P) - len(Z)) prod(z - Z) / prod(z - P)
+        log_H = log_H + 1j * W * (len(P) - len(Z))
+
+    chunk = max(1, FACTOR_CHUNK // max(1, len(Z) + len(P)))
+    with np.errstate(divide='ignore'):
+        for start in range(0, W.size, chunk):
+            part = points.ravel()[start:start + chunk, np.newaxis]
+            log_H.ravel()[start:start + chunk] += (np.log(part - Z).sum(axis=1) -
+                                                   np.log(part - P).sum(axis=1))
+    return log_H
+
+
+# Digital factors |e^jw - root| are seldom far from 1, so this many can be
+# multiplied before taking the logarithm without leaving the float range.
+MAGNITUDE_BLOCK = 16
+
+
+def zpk_log_magnitude(Z, P, K, W, analog=False):
+    """ ln |H| at W: the real part of zpk_log_response(), several times
+        faster, with no complex logarithm. Digital factors are multiplied
+        MAGNITUDE_BLOCK at a time, analog ones (which can be huge) one by
+        one. """
+    W = np.asarray(W, dtype=float)
+    Z = np.atleast_1d(np.asarray(Z, dtype=complex))
+    P = np.atleast_1d(np.asarray(P, dtype=complex))
+    points = 1j * W if analog else np.exp(1j * W)
+    block = 1 if analog else MAGNITUDE_BLOCK
+
+    def log_distances(part, roots):
+        distances = np.abs(part - roots)
+        return sum(np.log(np.prod(distances[:, start:start + block], axis=1))
+                   for start in range(0, roots.size, block))
+
+    log_H = np.full(W.shape, np.log(abs(K)) if K != 0 else -np.inf)
+    chunk = max(1, FACTOR_CHUNK // max(1, len(Z) + len(P)))
+    with np.errstate(divide='ignore'):
+        for start in range(0, W.size, chunk):
+            part = points.ravel()[start:start + chunk, np.newaxis]
+            log_H.ravel()[start:start + chunk] += (log_distances(part, Z) -
+                                                   log_distances(part, P))
+    return log_H
+
+
+@lru_cache(maxsize=32)
+def log_grid(start, stop, num):
+    """ A logarithmic FrequencyGrid in Hz, built once for each range. """
+    return FrequencyGrid(start, stop, num, scale='log', units='hz')
+
+
+def sos_response(SOS, W):
+    """ H at the angular frequencies W (radians/sample) of a cascade of
+        second-order sections, every section and frequency at once. """
+    W = np.asarray(W, dtype=float)
+    delay = np.exp(-1j * W)[..., np.newaxis]
+    powers = np.stack([np.ones_like(delay), delay, delay ** 2], axis=-1)
+    SOS = np.asarray(SOS)
+    chunk = max(1, FACTOR_CHUNK // max(1, len(SOS)))
+    H = np.empty(W.shape, dtype=complex)
+    for start in range(0, W.size, chunk):
+        part = powers.reshape(-1, 1, 3)[start:start + chunk]
+        sections = (part * SOS[:, :3]).sum(axis=-1) / (part * SOS[:, 3:]).sum(axis=-1)
+        H.ravel()[start:start + chunk] = np.prod(sections, axis=-1)
+    return H
+
+
+def zpk_group_delay(Z, P, W, analog=False):
+    """ The group delay at the angular frequencies W (in samples if
+        digital, in seconds if analog), summing what each zero and pole
+        adds: Re(z / (z - root)) for z = e^jW, or Re(1 / (jW - root)). """
+    W = np.asarray(W, dtype=float)
+    Z = np.atleast_1d(np.asarray(Z, dtype=complex))
+    P = np.atleast_1d(np.asarray(P, dtype=complex))
+    points = 1j * W if analog else np.exp(1j * W)
+
+    # The z^(len(P) - len(Z)) of H(z) delays by len(Z) - len(P) samples.
+    delay = np.full(W.shape, 0.0 if analog else float(len(Z) - len(P)))
+    chunk = max(1, FACTOR_CHUNK // max(1, len(Z) + len(P)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for start in range(0, W.size, chunk):
+            part = points.ravel()[start:start + chunk, np.newaxis]
+            if analog:
+                roots = np.real(1 / (part - P)).sum(axis=1) - np.real(1 / (part - Z)).sum(axis=1)
+            else:
+                roots = np.real(part / (part - P)).sum(axis=1) - np.real(part / (part - Z)).sum(axis=1)
+            delay.ravel()[start:start + chunk] += roots
+    return delay
+
+
+def polynomial_group_delay(coefficients, W):
+    """ The group delay, in samples, of the polynomials in z^-1 in the
+        rows of coefficients, at W (radians/sample): Re(D(n b) / D(b)),
+        D being the transform at W. Returns one row per polynomial. """
+    coefficients = np.atleast_2d(np.asarray(coefficients, dtype=float))
+    W = np.asarray(W, dtype=float)
+    n = np.arange(coefficients.shape[1])
+    delay = np.empty((len(coefficients), W.size))
+    chunk = max(1, FACTOR_CHUNK // coefficients.shape[1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for start in range(0, W.size, chunk):
+            powers = np.exp(-1j * np.multiply.outer(n, W.ravel()[start:start + chunk]))
+            delay[:, start:start + chunk] = np.real((coefficients * n) @ powers /
+                                                    (coefficients @ powers))
+    return delay.reshape((len(coefficients),) + W.shape)
+
+
+def unwrapped_phase(W, H, group_delay, start=None):
+    """ The phase of H, unwrapped along W: each step gets the multiple
+        of 2 pi that brings it closest to what the group delay predicts,
+        so even coarse grids unwrap right. start is the phase at W[0] (as
+        unwrapped from W = 0); if None, the angle of H[0] is taken. """
+    W = np.asarray(W, dtype=float)
+    phase = np.angle(H)
+    predicted = -np.diff(W) * (group_delay[:-1] + group_delay[1:]) / 2
+    predicted = np.where(np.isfinite(predicted), predicted, 0.0)
+    step = np.diff(phase)
+    step = step - 2 * pi * np.round((step - predicted) / (2 * pi))
+    if start is None:
+        start = phase[0]
+    return start + np.concatenate(([0.0], np.cumsum(step)))
+
+
+def phase_delay(W, H, group_delay, start=None):
+    """ The phase delay -phase / W, with the phase unwrapped as
+        unwrapped_phase() does: start must be given for grids that do
+        not begin at W = 0. It is the group delay where W is zero. """
+    W = np.asarray(W, dtype=float)
+    phase = unwrapped_phase(W, H, group_delay, start)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(W != 0, -phase / np.where(W != 0, W, 1), group_delay)
+
+
+def batch_fir_response(filters, N=512, dtype=np.float64):
+    """ Frequency responses of many FIR filters of the same length at
+        once. filters is a list of FIRFilters (or of coefficient vectors),
+        or a (filters x taps) array. All the responses come from one
+        zero-padded real FFT along the taps; the points are the same as
+        signal.freqz(B, worN=N) gives, N of them in [0, pi).
+
+        With dtype=np.float32 the work (and the result, complex64) takes
+        half the memory. Returns W and a (filters x N) matrix H. """
+    coefficients = [getattr(design, 'B', design) for design in filters]
+    coefficients = np.asarray(coefficients, dtype=dtype)
+    if coefficients.ndim != 2:
+        raise ValueError("All the filters must have the same number of taps.")
+
+    # One FFT of 2N points gives N points up to (but not including) pi;
+    # longer filters are wrapped around, which is the same as sampling
+    # their DTFT on those points.
+    size = 2 * N
+    taps = coefficients.shape[1]
+    if taps > size:
+        padding = -taps % size
+        coefficients = np.pad(coefficients, [(0, 0), (0, padding)])
+        coefficients = coefficients.reshape(len(coefficients), -1, size).sum(axis=1)
+
+    H = fft.rfft(coefficients, size, axis=1)[:, :N]
+    W = np.arange(N) * (pi / N)
+    return W, H
+
+
+def magnitude_db(H):
+    """ |H| in dB, with zeros at -300 dB instead of -inf. """
+    return 20 * np.log10(np.maximum(np.abs(H), 1e-15))
+
+
+def _turns(db):
+    """ The indices where the slope of db changes sign. Changes below
+        1e-9 dB are rounding noise, and do not count; of a flat top (or
+        bottom), the highest (or lowest) point is taken. """
+    change = np.diff(db)
+    moving = np.nonzero(np.abs(change) > 1e-9)[0]
+    slope = np.sign(change[moving])
+    turns = []
+    for k in np.nonzero(slope[:-1] * slope[1:] < 0)[0]:
+        first, last = moving[k] + 1, moving[k + 1] + 1
+        top = db[first:last]
+        turns.append(first + (np.argmax(top) if slope[k] > 0 else np.argmin(top)))
+    return np.array(turns, dtype=int)
+
+
+def _vertices(W, db, turns):
+    """ The peak of the parabola through each turn and its neighbours. """
+    x0, x1, x2 = W[turns - 1], W[turns], W[turns + 1]
+    y0, y1, y2 = db[turns - 1], db[turns], db[turns + 1]
+    numerator = (x1 - x0) ** 2 * (y1 - y2) - (x1 - x2) ** 2 * (y1 - y0)
+    denominator = (x1 - x0) * (y1 - y2) - (x1 - x2) * (y1 - y0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vertex = x1 - 0.5 * numerator / denominator
+    vertex = np.where(np.isfinite(vertex), np.clip(vertex, x0, x2), x1)
+    # Close enough already: moving further changes nothing.
+    return vertex[np.abs(vertex - x1) > 1e-6 * (x2 - x0)]
+
+
+def adaptive_response(evaluate, bands, points=16, tolerance=0.1, max_depth=8,
+                      polish=3):
+    """ Evaluates a response on as few points as it can, and finds its
+        extrema. evaluate(W) gives H on the angular frequencies W; bands
+        is a list of (kind, start, stop, limit), limit being the spec in
+        dB (the least gain of a passband, the most of a stopband) or None.
+
+        Every band starts as a grid of points points. Then, for up to
+        max_depth rounds, the intervals are halved where the magnitude at
+        the middle is more than 10 * tolerance dB away from the straight
+        line between the ends -- or tolerance dB, when it is that close to
+        the limit. Whatever is REFINE_FLOOR dB below the limit is left
+        alone. Last, each extremum is polished by polish steps of parabolic
+        interpolation. All the new points of a step go in one call.
+
+        Returns an AdaptiveResponse: the W and H of every point, sorted,
+        and a BandExtrema for each band. """
+    W = [np.linspace(start, stop, points) for (_, start, stop, _) in bands]
+    limits = [limit for (_, _, _, limit) in bands]
+
+    def evaluate_all(new_W):
+        """ Evaluates every band at once, and splits the result. """
+        H = evaluate(np.concatenate(new_W))
+        return np.split(np.asarray(H), np.cumsum([len(w) for w in new_W])[:-1])
+
+    def for_refining(H, limit):
+        db = magnitude_db(H)
+        if limit is None:
+            return db
+        return np.maximum(db, limit - REFINE_FLOOR)
+
+    H = evaluate_all(W)
+    pending = [np.ones(len(w) - 1, dtype=bool) for w in W]
+
+    for _ in range(max_depth):
+        intervals = [np.nonzero(flags)[0] for flags in pending]
+        if not any(len(idx) for idx in intervals):
+            break
+        middles = [(w[idx] + w[idx + 1]) / 2 for w, idx in zip(W, intervals)]
+        new_H = evaluate_all(middles)
+
+        for band, limit in enumerate(limits):
+            idx, middle, h = intervals[band], middles[band], new_H[band]
+            if not len(idx):
+                continue
+            db = for_refining(H[band], limit)
+            db_middle = for_refining(h, limit)
+            error = np.abs(db_middle - (db[idx] + db[idx + 1]) / 2)
+            threshold = np.full(len(idx), 10.0 * tolerance)
+            if limit is not None:
+                distance = np.minimum(np.abs(db_middle - limit),
+                                      np.minimum(np.abs(db[idx] - limit),
+                                                 np.abs(db[idx + 1] - limit)))
+                threshold[distance < 10 * tolerance] = tolerance
+            split = error > threshold
+
+            # The k-th middle lands at idx[k] + 1 + k, between the
+            # intervals that will be looked at in the next round.
+            W[band] = np.insert(W[band], idx + 1, middle)
+            H[band] = np.insert(H[band], idx + 1, h)
+            flags = np.zeros(len(W[band]) - 1, dtype=bool)
+            position = idx + 1 + np.arange(len(idx))
+            flags[position - 1] = split
+            flags[position] = split
+            pending[band] = flags
+
+    for _ in range(polish):
+        vertices = []
+        for band, limit in enumerate(limits):
+            turns = _turns(for_refining(H[band], limit))
+            vertices.append(_vertices(W[band], magnitude_db(H[band]), turns))
+        if not any(len(vertex) for vertex in vertices):
+            break
+        new_H = evaluate_all(vertices)
+        for band in range(len(bands)):
+            position = np.searchsorted(W[band], vertices[band])
+            W[band] = np.insert(W[band], position, vertices[band])
+            H[band] = np.insert(H[band], position, new_H[band])
+
+    found = []
+    for band, (kind, start, stop, limit) in enumerate(bands):
+        db = magnitude_db(H[band])
+        lowest, highest = np.argmin(db), np.argmax(db)
+        turns = _turns(db)
+        found.append(BandExtrema(kind, start, stop, limit,
+                                 (W[band][lowest], db[lowest]),
+                                 (W[band][highest], db[highest]),
+                                 np.column_stack((W[band][turns], db[turns]))))
+
+    all_W, all_H = np.concatenate(W), np.concatenate(H)
+    order = np.argsort(all_W, kind='stable')
+    return AdaptiveResponse(all_W[order], all_H[order], found)
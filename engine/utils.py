@@ -45,6 +45,15 @@ class HTMLReport():
         self.HTML_text = self.HTML_text + generate_HTML_table(column_names,
                                                               column_data)
 
+    def put_sos(self, sos):
+        """ Writes the second-order sections of a filter as a table,
+            one row per biquad. """
+        columns = ['Section', 'b0', 'b1', 'b2', 'a0', 'a1', 'a2']
+        data = [list(range(1, len(sos) + 1))]
+        for idx in range(6):
+            data.append([section[idx] for section in sos])
+        self.put_table(columns, data)
+
     def write(self, close=True):
         """ Writes the HTML file. """
         self.output.write(bytes(self.HTML_text, 'UTF-8'))
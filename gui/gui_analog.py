@@ -26,7 +26,7 @@ sys.path.append('..')
 from engine import analog_new as analog
 from engine import utils
 from math import pi
-from numpy import log10, abs, angle, unwrap
+from numpy import abs
 
 import canvas
 from matplotlib.backends.backend_qt4 import NavigationToolbar2QT as NavigationToolbar
@@ -525,7 +525,7 @@ class StartQT4(QtGui.QMainWindow):
         self.ui.tfOutputHTML.load(url)
 
     def plot(self):
-        self.filter_design.compute_frequencies(N=1000)
+        frequencies, magnitude, phase = self.filter_design.log_response(N=1000, db=True)
         #self.ui.graphicsView.hide()
         #self.ui.graphicsView_2.hide()
         #self.ui.tab_plot.hide()
@@ -544,8 +544,7 @@ class StartQT4(QtGui.QMainWindow):
 
         self.ui.magnitudePlotWidget = canvas.StaticPlot(plot_tab_splitter, width=9,
                                                         height=6, dpi=80)
-        self.ui.magnitudePlotWidget.compute_initial_figure(self.filter_design.W/(2*pi),
-                                                           20 * log10(abs(self.filter_design.H)),
+        self.ui.magnitudePlotWidget.compute_initial_figure(frequencies, magnitude,
                                                            mode="logx")
         self.ui.magnitudePlotWidget.set_label("Frequency (Hz)", "Gain (dB)")
 
@@ -562,8 +561,7 @@ class StartQT4(QtGui.QMainWindow):
 
         self.ui.phasePlotWidget = canvas.StaticPlot(plot_tab_splitter, width=9,
                                                     height=6, dpi=80)
-        self.ui.phasePlotWidget.compute_initial_figure(self.filter_design.W/(2*pi),
-                                                       unwrap(angle(self.filter_design.H)) * 180/pi,
+        self.ui.phasePlotWidget.compute_initial_figure(frequencies, phase,
                                                        mode="logx")
         self.ui.phasePlotWidget.set_label("Frequency (Hz)", "Phase (°)")
         self.ui.phaseGraphToolbar = NavigationToolbar(self.ui.phasePlotWidget,
@@ -26,6 +26,7 @@ sys.path.append('..')
 
 from engine import digital
 from engine import utils
+from engine import response
 from math import pi
 from numpy import log10, abs, angle, unwrap, array
 
@@ -42,6 +43,10 @@ window_types = [('Rectangular', 'boxcar', 0, ''),
                 ('Hann', 'hann', 0, ''),
                 ('Kaiser', 'kaiser', 1, 'beta')]
 
+# The plots have a log frequency axis, so evaluate the response
+# on log-spaced points, up to the Nyquist frequency.
+PLOT_GRID = response.FrequencyGrid(1e-3, 1, 1000, scale='log', units='normalized')
+
 
 class StartQT4(QtGui.QMainWindow):
     common = None
@@ -124,6 +129,9 @@ class StartQT4(QtGui.QMainWindow):
 
         self.pick_widgets_for_filter_type()
         self.populate_window_list()
+        # Have the windows without parameters ready before the first design.
+        digital.FIRFilter.prewarm_windows([window_internal for (_, window_internal, num_parameters, _)
+                                           in window_types if num_parameters == 0])
         self.FIR_setup()
         self.configure_boxes_for_design_parameters()
         self.get_filter_TF()
@@ -688,12 +696,18 @@ class StartQT4(QtGui.QMainWindow):
 
         html.put_newline()
         html.put_table(columns, data)
+
+        if getattr(self.filter_design, 'SOS', None) is not None:
+            html.put_newline()
+            html.put_text("Second-order sections:")
+            html.put_sos(self.filter_design.SOS)
+
         html.put_text("</body>")
         html.write(close=True)
         self.ui.tfOutputHTML.load(url)
 
     def plot(self):
-        self.filter_design.compute_frequencies(N=1000)
+        self.filter_design.compute_frequencies(grid=PLOT_GRID)
         #self.ui.graphicsView.hide()
         #self.ui.graphicsView_2.hide()
         #self.ui.tab_plot.hide()
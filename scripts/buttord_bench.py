@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+
+# Compares the bandstop order estimation of custom_buttord with the
+# fminbound searches (fast=False), with the closed form (the default),
+# and vectorized over all the specs at once (custom_buttord_many).
+
+import sys
+import time
+import numpy as np
+
+sys.path.append('../engine')
+sys.path.append('engine')
+import custom
+
+num_specs = 2000
+random = np.random.RandomState(0)
+center = random.uniform(0.3, 0.6, num_specs)
+width = random.uniform(0.05, 0.2, num_specs)
+ws = np.stack([center - width / 2, center + width / 2], axis=1)
+wp = np.stack([ws[:, 0] * random.uniform(0.5, 0.95, num_specs),
+               ws[:, 1] + (0.98 - ws[:, 1]) * random.uniform(0.1, 0.9, num_specs)], axis=1)
+
+def run(label, function):
+    t = time.time()
+    result = function()
+    elapsed = time.time() - t
+    print("{:<30} {:10.2f} ms  {:8.2f} us/spec".format(label, elapsed * 1000,
+                                                      elapsed / num_specs * 1e6))
+    return elapsed, result
+
+print("Bandstop specs: ", num_specs)
+slow, (slow_orders, slow_wn) = run("fminbound (scalar)", lambda: list(zip(*[
+    custom.custom_buttord(wp[idx], ws[idx], 1, 60, fast=False) for idx in range(num_specs)])))
+fast, (fast_orders, fast_wn) = run("closed form (scalar)", lambda: list(zip(*[
+    custom.custom_buttord(wp[idx], ws[idx], 1, 60) for idx in range(num_specs)])))
+many, (many_orders, many_wn) = run("closed form (vectorized)",
+                                   lambda: custom.custom_buttord_many(wp, ws, 1, 60))
+
+print("Speedup, scalar: {:.1f}x, vectorized: {:.1f}x".format(slow / fast, slow / many))
+# fminbound stops within its tolerance of the optimum, so a spec whose
+# order is just below an integer gets one more from it than it needs.
+print("Specs with different orders: ", np.sum(np.array(slow_orders) != many_orders))
+print("Largest relative difference in Wn: ",
+      np.max(np.abs(np.array(slow_wn) - many_wn) / many_wn))
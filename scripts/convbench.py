@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+
+# Measures the constants behind FIRFilter's choice between direct
+# convolution and FFT overlap-save (FFT_COST_RATIO in engine/digital.py).
+
+import numpy as np, scipy.signal as signal, scipy.fft as fft
+import timeit
+
+x = np.random.randn(65536)
+
+mac_times = []
+for num_taps in [16, 32, 64, 128, 256, 512]:
+    b = np.random.randn(num_taps)
+    elapsed = min(timeit.repeat(lambda: signal.lfilter(b, 1.0, x), number=5, repeat=3)) / 5
+    mac_times.append(elapsed / (len(x) * num_taps))
+    print("Direct, {} taps: {:.3f} ns/MAC".format(num_taps, mac_times[-1] * 1e9))
+
+fft_times = []
+for nfft in [256, 1024, 4096, 16384, 65536]:
+    frames = np.random.randn(len(x) // nfft + 1, nfft)
+    spectrum = fft.rfft(np.random.randn(nfft))
+    run = lambda: fft.irfft(fft.rfft(frames, axis=-1) * spectrum, nfft, axis=-1)
+    elapsed = min(timeit.repeat(run, number=5, repeat=3)) / 5
+    fft_times.append(elapsed / (frames.shape[0] * nfft * np.log2(nfft)))
+    print("FFT, size {}: {:.3f} ns per n*log2(n)".format(nfft, fft_times[-1] * 1e9))
+
+# The direct convolution cost per MAC settles for long filters, which are
+# the only ones where the FFT has a chance.
+print("FFT_COST_RATIO = {:.1f}".format(np.median(fft_times) / np.min(mac_times)))
@@ -1,8 +1,19 @@
 #!/usr/bin/env python3
 
+# Times the window FIR designs: firwin2, and the paths FIRFilter takes
+# from LARGE_FIR_TAPS on (frequency sampling with cached windows for any
+# gains, the closed form of firwin for steps), side by side.
+
+import sys
+import io
+import contextlib
 import numpy as np, scipy as sp, scipy.signal as signal
 import matplotlib.pyplot as plt
 import timeit
+
+sys.path.append('../engine')
+sys.path.append('engine')
+import digital
 # Forçar o uso de LaTeX
 import matplotlib
 from matplotlib import rc
@@ -16,7 +27,25 @@ matplotlib.rc('ytick', labelsize=20)
 
 def design_FIR(taps, sample_rate):
     nyquist = sample_rate/2
-    return signal.firwin2(taps, [0, nyquist/2, nyquist], [1, 1, 0], nyq=nyquist)
+    return signal.firwin2(taps, [0, nyquist/2, nyquist], [1, 1, 0], fs=sample_rate)
+
+def design_engine(taps, sample_rate, freqs, gains):
+    """ Designs through FIRFilter, without its design cache (and its prints). """
+    fir = digital.FIRFilter(sample_rate, taps, list(freqs), list(gains), 'hamming')
+    fir.use_cache = False
+    with contextlib.redirect_stdout(io.StringIO()):
+        fir.design()
+    return fir.B
+
+def design_sampling(taps, sample_rate):
+    # A slope: frequency sampling.
+    nyquist = sample_rate/2
+    return design_engine(taps, sample_rate, [0, nyquist/2, nyquist], [1, 1, 0])
+
+def design_closed_form(taps, sample_rate):
+    # A step: the closed form.
+    nyquist = sample_rate/2
+    return design_engine(taps, sample_rate, [0, nyquist/2, nyquist/2, nyquist], [1, 1, 0, 0])
 
 import time
 t = time.time()
@@ -26,17 +55,23 @@ elapsed = time.time() - t
 print(elapsed)
 len(b)
 
-speeds = []
+paths = [("firwin2", design_FIR), ("amostragem", design_sampling),
+         ("forma fechada", design_closed_form)]
+speeds = {name: [] for name, _ in paths}
 for num_taps in [1, 2, 4, 8, 10, 16, 30, 32, 60, 64, 120, 128, 250, 256, 500, 512, 1000, 1024, 2000, 2048, 4000, 4096, 5000, 6000, 7000, 8000, 8192, 9000, 10000, 10500, 11000, 11500, 12000, 12500, 13000, 13500, 14000, 14500, 15000, 15500, 16000, 16384, 20000, 30000, 32768, 40000, 50000, 60000, 65000, 65536]:
     print("Número de taps: ", num_taps)
-    times = []
-    for _ in range(1000):
-        t = time.time()
-        b = design_FIR(num_taps, 1000)
-        elapsed = time.time() - t
-        times.append(elapsed)
+    for name, design in paths:
+        if name != "firwin2" and num_taps < digital.LARGE_FIR_TAPS:
+            continue  # Below it, FIRFilter uses firwin2 too.
+        times = []
+        for _ in range(1000):
+            t = time.time()
+            b = design(num_taps, 1000)
+            elapsed = time.time() - t
+            times.append(elapsed)
 
-    speeds.append((num_taps, np.mean(times), np.min(times), np.max(times)))
+        speeds[name].append((num_taps, np.mean(times), np.min(times), np.max(times)))
+        print("    {}: {:.3f} ms".format(name, np.mean(times) * 1000))
 
 import pickle
 output = open('fir_result.pkl', 'wb')
@@ -45,16 +80,14 @@ pickle.dump(speeds, output)
 output.close()
 
 fig = plt.figure(1, figsize=(12, 9))
-plt.plot([taps for (taps, time, _, _) in speeds], [time*1000 for (taps, time, _, _) in speeds], 'k^-', linewidth=1.5, markersize=9)
-plt.plot([taps for (taps, _, min_time, _) in speeds], [min_time*1000 for (taps, _, min_time, _) in speeds], 'k--', linewidth=1.5, markersize=2)
-plt.plot([taps for (taps, _, _, max_time) in speeds], [max_time*1000 for (taps, _, _, max_time) in speeds], 'ko-', linewidth=1.5, markersize=2)
-
+for (name, _), style in zip(paths, ['k^-', 'ko-', 'ks-']):
+    plt.plot([taps for (taps, time, _, _) in speeds[name]], [time*1000 for (taps, time, _, _) in speeds[name]], style, linewidth=1.5, markersize=6)
 plt.xlabel("N\\'umero de taps", fontsize=19)
 plt.ylabel('tempo (ms)', fontsize=19)
 #plt.axis([1, 66000, 0, 30])
 plt.grid()
 plt.title('Filtro FIR simples passa-baixa: tempo de computa\c{c}\~ao (1000 execu\c{c}\~oes)', fontsize=19)
-plt.legend(["Tempo m\\'edio", "Tempo m\\'inimo", "Tempo m\\'aximo"], loc='best', fontsize=19)
+plt.legend(["Tempo m\\'edio, " + name for name, _ in paths], loc='best', fontsize=19)
 plt.show()
 plt.savefig('FIR_benchmark.svg')
 
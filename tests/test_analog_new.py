@@ -14,6 +14,8 @@ sys.path.append('../engine')
 sys.path.append('..')
 
 from engine import analog_new as analog
+import numpy as np
+from scipy import signal
 
 class TestAnalog(unittest.TestCase):
     filter_under_test = None
@@ -928,5 +930,59 @@ class TestAnalog(unittest.TestCase):
         for idx, coef in enumerate(target_values):
             self.assertAlmostEqual(butterworth.H[idx], coef, places=3)
 
+    def test_log_response(self):
+        ellip = analog.EllipticFilter()
+        ellip.N = 5
+        ellip.Wn = 2 * pi * 1000
+        ellip.ripple = 1
+        ellip.stopband_attenuation = 40
+        ellip.filter_kind = 'lowpass'
+        ellip.design()
+
+        f, H = ellip.log_response(10, 1e5, N=400)
+        self.assertAlmostEqual(f[0], 10)
+        self.assertAlmostEqual(f[-1], 1e5)
+        self.assertTrue(np.allclose(np.diff(np.log(f)), np.log(f[1] / f[0])))
+        _, expected = signal.freqs(ellip.B, ellip.A, worN=2 * pi * f)
+        self.assertTrue(np.allclose(H, expected))
+
+        f, magnitude, phase = ellip.log_response(10, 1e5, N=400, db=True)
+        self.assertTrue(np.allclose(magnitude, 20 * np.log10(np.abs(expected))))
+        # Same phase as unwrapping, up to the jumps of the zeros on the axis.
+        wrapped = np.angle(np.exp(1j * np.radians(phase)) / expected)
+        self.assertTrue(np.allclose(wrapped, 0, atol=1e-9))
+        self.assertAlmostEqual(phase[0], 0, delta=2)
+
+        # By default, the range freqs would use.
+        f, _ = ellip.log_response()
+        self.assertEqual(len(f), 1000)
+        self.assertLess(f[0], 100)
+        self.assertGreater(f[-1], 1e4)
+
+    def test_impulse_and_step(self):
+        """ The sampled responses must match the continuous ones, and
+            last until the slowest pole has died out. """
+        cheby2 = analog.ChebyshevIIFilter()
+        cheby2.N = 6
+        cheby2.Wn = 2 * pi * 100
+        cheby2.stopband_attenuation = 60
+        cheby2.filter_kind = 'lowpass'
+        cheby2.design()
+
+        T, h = cheby2.impulse_response(tolerance=1e-6)
+        _, expected = signal.impulse((cheby2.B, cheby2.A), T=T)
+        self.assertTrue(np.allclose(h, expected, atol=1e-9 * np.max(np.abs(h))))
+        slowest = -np.max(np.real(cheby2.P))
+        self.assertAlmostEqual(np.exp(-slowest * T[-1]), 1e-6, delta=1e-7)
+
+        T, step = cheby2.step_response()
+        _, expected = signal.step((cheby2.B, cheby2.A), T=T)
+        self.assertTrue(np.allclose(step, expected, atol=1e-9))
+        self.assertAlmostEqual(step[-1], 1.0, places=4)
+
+        cheby2.P = np.array([1.0])
+        with self.assertRaises(ValueError):
+            cheby2.impulse_response()
+
 if __name__ == '__main__':
     unittest.main()
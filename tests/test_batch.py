@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+# coding: utf-8
+# pyfilter: a Python program for filter synthesis and analysis.
+# (c) 2015 Renan Birck <renan.ee.ufsm@gmail.com>
+
+""" This module is a testbench for designing many filters at once. """
+import unittest
+import sys
+
+sys.path.append('../engine')
+sys.path.append('..')
+
+import numpy as np
+from engine import digital, batch
+
+
+class TestBatch(unittest.TestCase):
+
+    def make_specs(self):
+        specs = []
+        for stopband in [100, 150, 200]:
+            specs.append({'family': 'digital.EllipticFilter',
+                          'passband_frequency': 50,
+                          'stopband_frequency': stopband,
+                          'passband_attenuation': 1,
+                          'stopband_attenuation': 60,
+                          'ripple': 1,
+                          'sample_rate': 1000})
+        specs.append({'family': 'analog_new.ButterworthFilter',
+                      'passband_frequency': [10, 20],
+                      'stopband_frequency': [5, 40],
+                      'passband_attenuation': 3,
+                      'stopband_attenuation': 40,
+                      'target': 'passband'})
+        specs.append({'family': 'digital.NoSuchFilter',
+                      'passband_frequency': 50,
+                      'stopband_frequency': 100})
+        return specs
+
+    def check(self, results):
+        self.assertEqual(len(results), 5)
+
+        ellip = digital.EllipticFilter({'passband_frequency': 50,
+                                        'stopband_frequency': 100,
+                                        'passband_attenuation': 1,
+                                        'stopband_attenuation': 60,
+                                        'ripple': 1})
+        ellip.sample_rate = 1000
+        ellip.compute_parameters()
+        ellip.design()
+
+        self.assertEqual(results.orders[0], ellip.N)
+        self.assertAlmostEqual(results.wn[0, 0], ellip.Wn)
+        self.assertTrue(np.isnan(results.wn[0, 1]))
+        B, A = results.coefficients(0)
+        self.assertTrue(np.allclose(B, ellip.B))
+        self.assertTrue(np.allclose(A, ellip.A))
+
+        # Wider transition bands need lower orders.
+        self.assertTrue(results.orders[0] >= results.orders[1] >= results.orders[2])
+        self.assertFalse(np.isnan(results.wn[3, 1]))
+
+        self.assertEqual(results.orders[4], -1)
+        self.assertIn('NoSuchFilter', results.errors[4])
+        self.assertEqual(len(results.coefficients(4)[0]), 0)
+
+    def test_design_many_in_process(self):
+        self.check(batch.design_many(self.make_specs(), jobs=1))
+
+    def test_design_many_pool(self):
+        self.check(batch.design_many(self.make_specs(), jobs=2, chunk_size=2))
+
+    def test_design_many_from_spec(self):
+        ellip = digital.EllipticFilter({'passband_frequency': 50,
+                                        'stopband_frequency': 100,
+                                        'passband_attenuation': 1,
+                                        'stopband_attenuation': 60,
+                                        'ripple': 1})
+        ellip.sample_rate = 1000
+        results = batch.design_many([ellip.get_spec()], jobs=1)
+        ellip.compute_parameters()
+        self.assertEqual(results.orders[0], ellip.N)
+
+    def test_design_many_verify(self):
+        results = batch.design_many(self.make_specs(), jobs=1, verify=True)
+        self.assertTrue(np.all(results.passed[:4]))
+        self.assertFalse(results.passed[4])  # It failed to design at all.
+        self.assertTrue(np.all(results.margins[:3, :2] >= -1e-6))
+        self.assertTrue(np.all(np.isnan(results.margins[:3, 2])))  # Two bands.
+        self.assertFalse(np.any(np.isnan(results.margins[3])))  # Three bands.
+        self.assertIsNone(batch.design_many(self.make_specs(), jobs=1).margins)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+# coding: utf-8
+# pyfilter: a Python program for filter synthesis and analysis.
+# (c) 2015 Renan Birck <renan.ee.ufsm@gmail.com>
+
+""" This module is a testbench for the design caches. """
+import unittest
+import sys
+import os
+import tempfile
+
+sys.path.append('../engine')
+sys.path.append('..')
+
+import numpy as np
+from engine import digital
+from engine import cache
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_eviction_and_counters(self):
+        lru = cache.LRUCache(maxsize=2)
+        lru.put('a', 1)
+        lru.put('b', 2)
+        self.assertEqual(lru.get('a'), 1)  # Now 'b' is the oldest.
+        lru.put('c', 3)
+
+        self.assertNotIn('b', lru)
+        self.assertEqual(lru.get('b'), None)
+        self.assertEqual(lru.info(), {'hits': 1, 'misses': 1,
+                                      'size': 2, 'maxsize': 2})
+
+    def test_byte_limit(self):
+        lru = cache.LRUCache(maxsize=10, max_bytes=2000)
+        lru.put('a', np.zeros(100))  # 800 bytes each.
+        lru.put('b', (np.zeros(50), np.zeros(50)))
+        lru.put('c', {'W': np.zeros(100)})
+        self.assertNotIn('a', lru)
+        self.assertEqual(lru.info()['bytes'], 1600)
+
+        lru.put('c', np.zeros(10))  # Replacing frees the old bytes.
+        self.assertEqual(lru.nbytes, 880)
+
+    def test_designs_bounded(self):
+        """ Long FIR designs are evicted by their size, not only by
+            their number. """
+        designs = digital.Filter.design_cache
+        self.assertIsNotNone(designs.max_bytes)
+        self.assertIsNotNone(digital.Filter.parameters_cache.max_bytes)
+
+        max_bytes, designs.max_bytes = designs.max_bytes, 80000  # Two of them.
+        try:
+            designs.clear()
+            for taps in [4001, 4003, 4005, 4007]:
+                fir = digital.FIRFilter(8000, taps, [0, 1000, 1100, 4000], [1, 1, 0, 0],
+                                         'hamming')
+                fir.design()
+            self.assertEqual(len(designs), 2)
+            self.assertLessEqual(designs.nbytes, 80000)
+        finally:
+            designs.max_bytes = max_bytes
+            designs.clear()
+
+
+class TestDiskCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory(prefix='pyfilter')
+
+    def tearDown(self):
+        digital.Filter.disk_cache = None
+        self.directory.cleanup()
+
+    def test_put_get(self):
+        disk = cache.DiskCache(self.directory.name)
+        disk.put(('spec', 1), {'B': np.arange(4.0), 'N': np.array(3)})
+
+        stored = disk.get(('spec', 1))
+        self.assertTrue(np.array_equal(stored['B'], np.arange(4.0)))
+        self.assertEqual(disk.get(('spec', 2)), None)
+        self.assertEqual(disk.info()['size'], 1)
+        self.assertEqual([name for name in os.listdir(self.directory.name)
+                          if name.endswith('.tmp')], [])
+
+    def test_evict_least_recently_used(self):
+        disk = cache.DiskCache(self.directory.name)
+        for key in range(3):
+            disk.put(key, {'B': np.zeros(1000)})
+            os.utime(disk.path_for(key), (key, key))
+        disk.get(0)  # Recently used now.
+
+        disk.max_bytes = 2 * os.path.getsize(disk.path_for(0))
+        disk.evict()
+        self.assertTrue(os.path.exists(disk.path_for(0)))
+        self.assertFalse(os.path.exists(disk.path_for(1)))
+        self.assertTrue(os.path.exists(disk.path_for(2)))
+
+    def test_designs_from_disk(self):
+        """ A design done once must be reloaded from the disk,
+            even when the memory caches are empty. """
+        digital.Filter.disk_cache = cache.DiskCache(self.directory.name)
+        parameters = {'passband_frequency': 10,
+                      'stopband_frequency': 100,
+                      'passband_attenuation': 1,
+                      'stopband_attenuation': 80}
+
+        designs = []
+        for _ in range(2):
+            digital.Filter.parameters_cache.clear()
+            digital.Filter.design_cache.clear()
+            digital.Filter.response_cache.clear()
+            ellip = digital.EllipticFilter(parameters)
+            ellip.sample_rate = 500
+            ellip.ripple = 1
+            ellip.compute_parameters()
+            ellip.design()
+            ellip.compute_frequencies(N=100)
+            designs.append(ellip)
+
+        self.assertEqual(digital.Filter.disk_cache.info()['hits'], 3)
+        self.assertEqual(designs[1].N, 3)
+        self.assertTrue(np.allclose(designs[0].Z, designs[1].Z))
+        self.assertTrue(np.allclose(designs[0].B, designs[1].B))
+        self.assertTrue(np.allclose(designs[0].H, designs[1].H))
+
+
+if __name__ == '__main__':
+    unittest.main()
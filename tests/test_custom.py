@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+# coding: utf-8
+# pyfilter: a Python program for filter synthesis and analysis.
+# (c) 2015 Renan Birck <renan.ee.ufsm@gmail.com>
+
+""" This module is a testbench for the vectorized versions of the
+    functions in custom.py, which must agree with the scalar ones. """
+import unittest
+import sys
+
+sys.path.append('../engine')
+sys.path.append('..')
+
+import numpy as np
+from scipy import optimize, signal
+from scipy.signal import band_stop_obj
+from engine import custom
+
+
+class TestCustomButtordMany(unittest.TestCase):
+
+    def compare(self, wp, ws, gpass, gstop, analog, fast=True):
+        orders, wns = custom.custom_buttord_many(wp, ws, gpass, gstop, analog)
+        gpass = np.broadcast_to(gpass, len(wp))
+        gstop = np.broadcast_to(gstop, len(wp))
+        for idx in range(len(wp)):
+            order, wn = custom.custom_buttord(wp[idx], ws[idx], gpass[idx],
+                                              gstop[idx], analog, fast)
+            self.assertEqual(orders[idx], order)
+            self.assertTrue(np.allclose(wns[idx], wn))
+
+    def test_lowpass_highpass(self):
+        random = np.random.RandomState(0)
+        wp = random.uniform(0.05, 0.9, 200)
+        ws = np.where(random.rand(200) < 0.5, wp * 1.3, wp * 0.7)
+        ws = np.clip(ws, 0.01, 0.99)
+        gstop = random.uniform(20, 80, 200)
+        self.compare(wp, ws, 1, gstop, analog=False)
+        self.compare(wp * 1000, ws * 1000, 3, gstop, analog=True)
+
+    def test_bandpass(self):
+        random = np.random.RandomState(1)
+        center = random.uniform(0.3, 0.6, 100)
+        width = random.uniform(0.05, 0.2, 100)
+        wp = np.stack([center - width / 2, center + width / 2], axis=1)
+        ws = np.stack([wp[:, 0] * 0.8, wp[:, 1] * 1.2], axis=1)
+        self.compare(wp, ws, random.uniform(0.5, 3, 100), 60, analog=False)
+        self.compare(wp * 100, ws * 100, 1, 40, analog=True)
+
+    def make_bandstop(self, count, seed):
+        random = np.random.RandomState(seed)
+        center = random.uniform(0.3, 0.6, count)
+        width = random.uniform(0.05, 0.2, count)
+        ws = np.stack([center - width / 2, center + width / 2], axis=1)
+        wp = np.stack([ws[:, 0] * random.uniform(0.5, 0.95, count),
+                       ws[:, 1] + (0.98 - ws[:, 1]) * random.uniform(0.1, 0.9, count)], axis=1)
+        return wp, ws
+
+    def test_band_stop_edges(self):
+        """ The closed form must agree with the fminbound searches
+            it replaced. """
+        wp, ws = self.make_bandstop(50, 2)
+        passb, stopb = np.tan(np.pi * wp / 2), np.tan(np.pi * ws / 2)
+        edges = custom.band_stop_edges(passb, stopb)
+
+        for idx in range(len(wp)):
+            reference = passb[idx].copy()
+            reference[0] = optimize.fminbound(band_stop_obj, reference[0],
+                                              stopb[idx, 0] - 1e-12,
+                                              args=(0, reference, stopb[idx], 1, 60, 'butter'),
+                                              disp=0)
+            reference[1] = optimize.fminbound(band_stop_obj, stopb[idx, 1] + 1e-12,
+                                              reference[1],
+                                              args=(1, reference, stopb[idx], 1, 60, 'butter'),
+                                              disp=0)
+            self.assertTrue(np.allclose(edges[idx], reference, rtol=1e-4))
+
+            self.assertTrue(np.allclose(custom.band_stop_edges(passb[idx], stopb[idx]),
+                                        edges[idx]))
+
+    def test_bandstop(self):
+        wp, ws = self.make_bandstop(100, 3)
+        self.compare(wp, ws, 1, 60, analog=False)
+        self.compare(wp * 100, ws * 100, 3, 40, analog=True)
+
+        # The fast path gives the same order as the searches,
+        # and the same frequencies within their tolerance.
+        for idx in range(len(wp)):
+            order, wn = custom.custom_buttord(wp[idx], ws[idx], 1, 60, fast=False)
+            fast_order, fast_wn = custom.custom_buttord(wp[idx], ws[idx], 1, 60)
+            self.assertEqual(order, fast_order)
+            self.assertEqual(order, signal.buttord(wp[idx], ws[idx], 1, 60)[0])
+            self.assertTrue(np.allclose(wn, fast_wn, rtol=1e-4))
+
+    def test_bandstop_order_below_integer(self):
+        """ Here the exact order is 5.99999...: the searches stop short
+            of the optimum and ask for 7, while 6 meets the spec. """
+        wp, ws = [0.196442879229, 0.497989903916], [0.297336752717, 0.383035960692]
+        self.assertEqual(custom.custom_buttord(wp, ws, 1, 60, fast=False)[0], 7)
+        order, wn = custom.custom_buttord(wp, ws, 1, 60)
+        self.assertEqual(order, 6)
+
+        SOS = signal.butter(order, wn, 'bandstop', output='sos')
+        _, passband = signal.sosfreqz(SOS, worN=np.pi * np.concatenate(
+            (np.linspace(0, wp[0], 500), np.linspace(wp[1], 1, 500))))
+        _, stopband = signal.sosfreqz(SOS, worN=np.pi * np.linspace(ws[0], ws[1], 5000))
+        self.assertGreater(np.min(20 * np.log10(np.abs(passband))), -1 - 1e-6)
+        self.assertLess(np.max(20 * np.log10(np.abs(stopband))), -60 + 1e-6)
+
+    def test_bad_shapes(self):
+        with self.assertRaises(ValueError):
+            custom.custom_buttord_many([0.1, 0.2], [0.3], 1, 40)
+
+
+if __name__ == '__main__':
+    unittest.main()
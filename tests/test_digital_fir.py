@@ -5,12 +5,16 @@
 
 """ This module is a testbench for the DigitalFilter class. """
 import unittest
+from unittest import mock
 import sys
+import time
 
 sys.path.append('../engine')
 sys.path.append('..')
 
 from engine import digital
+import numpy as np
+from scipy import signal
 
 
 class TestFIR(unittest.TestCase):
@@ -105,6 +109,232 @@ class TestFIR(unittest.TestCase):
         for idx, coef in enumerate(target_B_coefs):
             self.assertAlmostEqual(fir_remez.B[idx], coef, places=3)
 
+    def test_process_blocks(self):
+        """ The FIR state must carry over between blocks. """
+        fir = digital.FIRFilter(self.sample_rate)
+        fir.B = signal.firwin(31, 0.3)
+
+        x = np.random.RandomState(0).randn(500)
+        expected = signal.lfilter(fir.B, 1.0, x)
+
+        blocks = [x[:7], x[7:8], x[8:250], x[250:]]
+        output = np.concatenate([fir.process(block) for block in blocks])
+        self.assertTrue(np.allclose(output, expected))
+
+    def test_process_long_filter(self):
+        """ A long filter goes through overlap-save, and must give
+            the same result as direct convolution. """
+        fir = digital.FIRFilter(self.sample_rate)
+        fir.B = signal.firwin(2049, 0.1)
+
+        x = np.random.RandomState(0).randn(20000)
+        expected = signal.lfilter(fir.B, 1.0, x)
+
+        self.assertIsNotNone(fir._pick_fft_size(8000))
+        self.assertIsNone(fir._pick_fft_size(1))
+
+        blocks = [x[:8000], x[8000:8001], x[8001:]]
+        output = np.concatenate([fir.process(block) for block in blocks])
+        self.assertTrue(np.allclose(output, expected))
+
+    def test_process_multichannel(self):
+        """ Multichannel filtering, on both the direct and FFT paths. """
+        x = np.random.RandomState(0).randn(4, 5000)
+        for taps in [15, 1025]:
+            fir = digital.FIRFilter(self.sample_rate)
+            fir.B = signal.firwin(taps, 0.2)
+            expected = signal.lfilter(fir.B, 1.0, x, axis=-1)
+
+            data = np.asfortranarray(x)
+            first = fir.process(data[:, :3000])
+            self.assertTrue(first.flags.f_contiguous)
+            output = np.concatenate([first, fir.process(data[:, 3000:])], axis=-1)
+            self.assertTrue(np.allclose(output, expected))
+
+    def test_process_complex(self):
+        """ Complex blocks, on both the direct and FFT paths. """
+        x = np.random.RandomState(0).randn(2, 5000)
+        z = x[0] + 1j * x[1]
+        for taps in [15, 2049]:
+            fir = digital.FIRFilter(self.sample_rate)
+            fir.B = signal.firwin(taps, 0.2)
+            expected = signal.lfilter(fir.B, 1.0, np.concatenate((x[0, :10], z[10:])))
+            output = np.concatenate([fir.process(x[0, :10]), fir.process(z[10:11]),
+                                     fir.process(z[11:4000]), fir.process(z[4000:])])
+            self.assertTrue(np.allclose(output, expected))
+
+    def test_zoom_response(self):
+        fir = digital.FIRFilter(self.sample_rate)
+        fir.B = signal.firwin(301, 0.1)
+
+        fir.zoom_response(100, 150, 64)
+        expected = signal.freqz(fir.B, worN=np.linspace(100, 150, 64),
+                                fs=self.sample_rate)[1]
+        self.assertTrue(np.allclose(fir.H, expected))
+
+    def test_large_window_designs(self):
+        """ Long designs skip firwin2, but must give what it gives. """
+        taps = digital.LARGE_FIR_TAPS + 1
+
+        ramp = digital.FIRFilter(self.sample_rate, taps, [0, 300, 600], [0, 1, 1],
+                                 'hamming')
+        ramp.design()
+        expected = signal.firwin2(taps, [0.0, 300.0, 600.0, 1000.0], [0.0, 1.0, 1.0, 0.0],
+                                  window='hamming', fs=self.sample_rate)
+        self.assertTrue(np.allclose(ramp.B, expected))
+
+        # Steps have a closed form: firwin's.
+        bandpass = digital.FIRFilter(self.sample_rate, taps,
+                                     [0, 200, 200, 400, 400, 1000],
+                                     [0, 0, 1, 1, 0, 0], ('kaiser', 8))
+        bandpass.design()
+        expected = signal.firwin(taps, [200, 400], window=('kaiser', 8),
+                                 pass_zero=False, scale=False, fs=self.sample_rate)
+        self.assertTrue(np.allclose(bandpass.B, expected))
+
+    def test_kaiser_compute_parameters(self):
+        specs = [{'passband_frequency': 1000.0, 'stopband_frequency': 1200.0,
+                  'passband_attenuation': 0.1, 'stopband_attenuation': 60},
+                 {'passband_frequency': 1200.0, 'stopband_frequency': 1000.0,
+                  'passband_attenuation': 0.5, 'stopband_attenuation': 80},
+                 {'passband_frequency': [1000.0, 2000.0], 'stopband_frequency': [900.0, 2200.0],
+                  'passband_attenuation': 0.1, 'stopband_attenuation': 70},
+                 {'passband_frequency': [500.0, 3000.0], 'stopband_frequency': [1000.0, 2000.0],
+                  'passband_attenuation': 1, 'stopband_attenuation': 40}]
+        for parameters in specs:
+            fir = digital.FIRFilter(8000)
+            fir.set_parameters(parameters)
+            fir.compute_parameters()
+            self.assertEqual(fir.taps % 2, 1)
+            self.assertEqual(fir.window[0], 'kaiser')
+            passed, _ = fir.verify(N=32 * fir.taps, early_exit=False)
+            self.assertTrue(passed)
+
+            # The spec was left designed, so designing again is a hit.
+            hits = fir.design_cache.hits
+            fir.design()
+            self.assertEqual(fir.design_cache.hits, hits + 1)
+
+    def test_kaiser_many_taps(self):
+        """ A narrow transition takes over 10000 taps; checking them
+            must not dominate the design. """
+        fir = digital.FIRFilter(48000)
+        fir.set_parameters({'passband_frequency': 1000.0, 'stopband_frequency': 1020.0,
+                            'passband_attenuation': 0.1, 'stopband_attenuation': 80})
+        start = time.perf_counter()
+        fir.compute_parameters()
+        passed, _ = fir.verify(early_exit=False)
+        elapsed = time.perf_counter() - start
+        self.assertGreater(fir.taps, 10000)
+        self.assertTrue(passed)
+        self.assertLess(elapsed, 5)
+
+    def test_remez_compute_parameters(self):
+        parameters = {'passband_frequency': 1200.0, 'stopband_frequency': 1000.0,
+                      'passband_attenuation': 0.5, 'stopband_attenuation': 80}
+        kaiser = digital.FIRFilter(8000)
+        kaiser.set_parameters(parameters)
+        kaiser.compute_parameters()
+
+        for jobs in [1, 2]:
+            fir = digital.FIRFilter(8000)
+            fir.set_parameters(parameters)
+            fir.compute_remez_parameters(jobs=jobs)
+            self.assertTrue(fir.verify(N=32 * fir.taps, early_exit=False)[0])
+            self.assertEqual(fir.taps % 2, 1)  # A highpass must be odd.
+            self.assertLess(fir.taps, kaiser.taps)
+
+            # And it is the shortest one.
+            shorter = digital.FIRFilter(8000, fir.taps - 2, fir.freqs, fir.gains)
+            shorter.weights = fir.weights
+            shorter.set_parameters(parameters)
+            shorter.design()
+            self.assertFalse(shorter.verify(N=32 * fir.taps)[0])
+
+        fir = digital.FIRFilter(8000)
+        fir.set_parameters(parameters)
+        with self.assertRaises(ValueError):
+            fir.compute_remez_parameters(jobs=1, max_taps=50)
+
+        # Designs that do not converge just fail, and the search goes on.
+        remez = signal.remez
+        def unstable_remez(taps, *args, **kwargs):
+            if taps % 4 == 1:
+                raise ValueError("Failure to converge at iteration 3, "
+                                 "try reducing transition band width.")
+            return remez(taps, *args, **kwargs)
+        with mock.patch.object(digital.signal, 'remez', unstable_remez):
+            fir.compute_remez_parameters(jobs=1)
+        self.assertEqual(fir.taps % 4, 3)
+        self.assertTrue(fir.verify(N=32 * fir.taps, early_exit=False)[0])
+
+    def test_least_squares(self):
+        freqs, gains, weights = [0, 200, 300, 600, 650, 1000], [1, 1, 0, 0, 0.5, 0], [1, 10, 2]
+        fir = digital.FIRFilter(self.sample_rate, 101, freqs, gains)
+        fir.weights = weights
+        fir.algorithm = 'least_squares'
+        fir.design()
+        expected = signal.firls(101, freqs, gains, weight=weights, fs=self.sample_rate)
+        self.assertTrue(np.allclose(fir.B, expected))
+
+        # Even lengths work too, as long as they do not pass nyquist.
+        fir.taps = 100
+        fir.design()
+        self.assertEqual(len(fir.B), 100)
+        self.assertTrue(np.allclose(fir.B, fir.B[::-1]))
+        with self.assertRaises(ValueError):
+            fir.gains = [0, 0, 1, 1, 1, 1]  # A highpass.
+            fir.design()
+
+        # Large designs are still quick, and right.
+        large = digital.FIRFilter(48000, 20001, [0, 1000, 1020, 24000], [1, 1, 0, 0])
+        large.algorithm = 'least_squares'
+        large.design()
+        W, H = signal.freqz(large.B, worN=1 << 16, fs=48000)
+        self.assertLess(np.max(np.abs(np.abs(H[W <= 1000]) - 1)), 1e-5)
+        self.assertLess(np.max(np.abs(H[W >= 1020])), 1e-5)
+
+    def test_remez_short_search(self):
+        """ Short filters, one length at a time: the search must move
+            on from lengths it already tried, and keep them odd. """
+        for passband, stopband in [(100.0, 250.0), (250.0, 100.0)]:
+            fir = digital.FIRFilter(1000)
+            fir.set_parameters({'passband_frequency': passband, 'stopband_frequency': stopband,
+                                'passband_attenuation': 3, 'stopband_attenuation': 20})
+            fir.compute_remez_parameters(jobs=1)
+            self.assertTrue(fir.verify(early_exit=False)[0])
+
+        # From an estimate far too high, it still comes down to the minimum.
+        for count in [1, 4]:
+            self.assertEqual(digital._shortest_length(None, lambda taps: taps >= 11,
+                                                      200, 2, 8192, count), 11)
+        self.assertEqual(digital._shortest_length(None, lambda taps: taps >= 300,
+                                                  200, 2, 301, 16), 301)
+
+    def test_window_cache(self):
+        windows = digital.FIRFilter.window_cache
+        windows.clear()
+        digital.FIRFilter.prewarm_windows(['hamming'], [64, 128])
+        self.assertEqual(len(windows), 2)
+
+        kaiser = digital.FIRFilter.get_window(('kaiser', 8), 4096)
+        self.assertTrue(np.array_equal(kaiser, signal.get_window(('kaiser', 8), 4096,
+                                                                 fftbins=False)))
+        self.assertIs(digital.FIRFilter.get_window(('kaiser', 8.0), 4096), kaiser)
+        self.assertIsNot(digital.FIRFilter.get_window(('kaiser', 6), 4096), kaiser)
+        # A number is the beta of a Kaiser window.
+        self.assertIs(digital.FIRFilter.get_window(8.0, 4096), kaiser)
+        self.assertIs(digital.FIRFilter.get_window(8, 4096), kaiser)
+        self.assertFalse(kaiser.flags.writeable)
+        self.assertLessEqual(windows.info()['bytes'], windows.max_bytes)
+
+        # The designs take their windows from it.
+        fir = digital.FIRFilter(self.sample_rate, 64, self.freqs, self.gains, 'hamming')
+        fir.use_cache = False  # Design it for real.
+        hits = windows.hits
+        fir.design()
+        self.assertEqual(windows.hits, hits + 1)
+
 
 if __name__ == '__main__':
     unittest.main()
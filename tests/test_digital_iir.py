@@ -5,12 +5,16 @@
 
 """ This module is a testbench for the DigitalFilter class. """
 import unittest
+from math import pi
 import sys
+import tracemalloc
 
 sys.path.append('../engine')
 sys.path.append('..')
 
 from engine import digital
+import numpy as np
+from scipy import signal
 
 class TestDigital(unittest.TestCase):
 
@@ -657,8 +661,10 @@ class TestDigital(unittest.TestCase):
         butter.design()
 
         self.assertEqual(butter.N, 4)
-        self.assertAlmostEqual(butter.Wn[0], 0.076018239965718007)
-        self.assertAlmostEqual(butter.Wn[1], 0.25143968885666007)
+        # MATLAB searches for the band edges to 1e-5; the closed form
+        # finds the exact ones.
+        self.assertAlmostEqual(butter.Wn[0], 0.076018239965718007, places=5)
+        self.assertAlmostEqual(butter.Wn[1], 0.25143968885666007, places=5)
 
         target_B_coefs = [481.405830693621e-003, -3.48435290477535e+000,
                           11.3828585629904e+000, -21.8614321972257e+000,
@@ -903,6 +909,197 @@ class TestDigital(unittest.TestCase):
             self.assertAlmostEqual(ellip.A[idx],
                                    coef, places=1)
 
+    def test_sos_high_order(self):
+        """ A high order elliptic design must give the same response
+            from its second-order sections as from its Z/P/K. """
+        ellip = digital.EllipticFilter()
+        ellip.sample_rate = 48000
+        ellip.N = 16
+        ellip.Wn = 0.2
+        ellip.ripple = 0.5
+        ellip.stopband_attenuation = 100
+        ellip.filter_kind = 'lowpass'
+        ellip.already_normalized_Wn = True
+        ellip.design()
+
+        self.assertEqual(ellip.SOS.shape, (8, 6))
+
+        ellip.compute_frequencies(N=1000)
+        _, H_zpk = signal.freqz_zpk(ellip.Z, ellip.P, ellip.K, worN=1000)
+        self.assertTrue(np.allclose(ellip.H, H_zpk, atol=1e-9))
+
+    def test_process_blocks(self):
+        """ Filtering in blocks of any size must match filtering
+            the whole signal at once. """
+        butterworth = digital.ButterworthFilter()
+        butterworth.sample_rate = 1000
+        butterworth.N = 6
+        butterworth.Wn = 100
+        butterworth.filter_kind = 'lowpass'
+        butterworth.design()
+
+        x = np.random.RandomState(0).randn(1000)
+        expected = signal.sosfilt(butterworth.SOS, x)
+
+        blocks = [x[:1], x[1:300], x[300:300], x[300:999], x[999:]]
+        output = np.concatenate([butterworth.process(block) for block in blocks])
+        self.assertTrue(np.allclose(output, expected))
+
+        butterworth.reset()
+        output = np.concatenate(list(butterworth.process_stream(blocks)))
+        self.assertTrue(np.allclose(output, expected))
+
+        # Complex samples keep their imaginary part through the state,
+        # even after real ones.
+        butterworth.reset()
+        z = x + 1j * np.random.RandomState(1).randn(1000)
+        output = np.concatenate([butterworth.process(x[:300]),
+                                 butterworth.process(z[300:700]),
+                                 butterworth.process(z[700:])])
+        expected = signal.sosfilt(butterworth.SOS, np.concatenate((x[:300], z[300:])))
+        self.assertTrue(np.allclose(output, expected))
+
+    def test_process_multichannel(self):
+        """ All the channels are filtered at once, each with its own
+            state, for C- and F-ordered input alike. """
+        cheby1 = digital.ChebyshevIFilter()
+        cheby1.sample_rate = 1000
+        cheby1.N = 4
+        cheby1.Wn = [50, 150]
+        cheby1.ripple = 1
+        cheby1.filter_kind = 'bandpass'
+        cheby1.design()
+
+        x = np.random.RandomState(0).randn(8, 600)
+        expected = signal.sosfilt(cheby1.SOS, x, axis=-1)
+
+        for data in [x, np.asfortranarray(x)]:
+            cheby1.reset()
+            output = np.concatenate([cheby1.process(data[:, :250]),
+                                     cheby1.process(data[:, 250:])], axis=-1)
+            self.assertTrue(np.allclose(output, expected))
+
+        with self.assertRaises(ValueError):
+            cheby1.process(x[:4, :10])
+
+    def test_process_fortran_order(self):
+        """ F-ordered (channels x samples) blocks are not copied whole:
+            the only allocation of their size is the output, which comes
+            in F order too. """
+        butterworth = digital.IIRFilter()
+        butterworth.sample_rate = 8000
+        butterworth.SOS = signal.butter(8, 0.2, output='sos')
+        x = np.asfortranarray(np.random.RandomState(0).randn(8, 1 << 17))
+
+        tracemalloc.start()
+        try:
+            output = butterworth.process(x)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak, 1.2 * x.nbytes)
+        self.assertTrue(output.flags.f_contiguous)
+        self.assertTrue(np.allclose(output, signal.sosfilt(butterworth.SOS, x, axis=-1)))
+
+    def test_design_cache(self):
+        """ Designing the same spec twice must come from the cache,
+            and give the same filter. """
+        parameters = {'passband_frequency': 10,
+                      'stopband_frequency': 100,
+                      'passband_attenuation': 1,
+                      'stopband_attenuation': 80}
+        design_cache = digital.IIRFilter.design_cache
+        parameters_cache = digital.IIRFilter.parameters_cache
+        design_cache.clear()
+        parameters_cache.clear()
+
+        designs = []
+        for _ in range(2):
+            ellip = digital.EllipticFilter(parameters)
+            ellip.sample_rate = 500
+            ellip.ripple = 1
+            ellip.compute_parameters()
+            ellip.design()
+            designs.append(ellip)
+
+        self.assertEqual(parameters_cache.info()['hits'], 1)
+        self.assertEqual(design_cache.info()['hits'], 1)
+        self.assertEqual(designs[0].get_spec(), designs[1].get_spec())
+        self.assertEqual(designs[1].N, 3)
+        self.assertTrue(np.array_equal(designs[0].P, designs[1].P))
+        self.assertTrue(np.array_equal(designs[0].B, designs[1].B))
+
+        # Another ripple is another design.
+        designs[1].ripple = 2
+        designs[1].design()
+        self.assertEqual(design_cache.info()['misses'], 2)
+
+        # The parameters given are not converted in place.
+        self.assertEqual(parameters['passband_frequency'], 10)
+
+        # What a step sets is cached even if it was already there.
+        parameters_cache.clear()
+        designs = []
+        for stale_N in [3, 7]:
+            ellip = digital.EllipticFilter(parameters)
+            ellip.sample_rate = 500
+            ellip.ripple = 1
+            ellip.N = stale_N
+            ellip.compute_parameters()
+            designs.append(ellip)
+        self.assertEqual(parameters_cache.info()['hits'], 1)
+        self.assertEqual(designs[1].N, 3)
+
+    def test_zoom_response(self):
+        notch = digital.ButterworthFilter()
+        notch.sample_rate = 8000
+        notch.N = 4
+        notch.Wn = [58, 62]  # Hz, a 60 Hz notch.
+        notch.filter_kind = "bandstop"
+        notch.design()
+
+        notch.zoom_response(55, 65, 501)
+        self.assertEqual(len(notch.W), 501)
+        _, expected = signal.sosfreqz(notch.SOS, worN=np.linspace(55, 65, 501), fs=8000)
+        self.assertTrue(np.allclose(notch.W, 2 * pi * np.linspace(55, 65, 501) / 8000))
+        self.assertTrue(np.allclose(notch.H, expected, atol=1e-9))
+        # The notch is inside the band looked at.
+        self.assertLess(abs(notch.H[250]), 1e-3)  # 60 Hz
+        self.assertGreater(abs(notch.H[0]), 0.9)  # 55 Hz
+
+        with self.assertRaises(ValueError):
+            notch.zoom_response(65, 55)
+
+    def test_impulse_and_step(self):
+        cheby2 = digital.ChebyshevIIFilter()
+        cheby2.sample_rate = 1000
+        cheby2.N = 8
+        cheby2.Wn = 20
+        cheby2.stopband_attenuation = 60
+        cheby2.filter_kind = "lowpass"
+        cheby2.design()
+
+        T, h = cheby2.impulse_response(tolerance=1e-6)
+        self.assertGreaterEqual(len(h), cheby2.response_length(1e-6))
+        self.assertAlmostEqual(T[1], 1e-3)
+        self.assertLess(np.max(np.abs(h[-len(h) // 10:])), 1e-6 * np.max(np.abs(h)))
+        impulse = np.zeros(len(h))
+        impulse[0] = 1
+        self.assertTrue(np.allclose(h, signal.sosfilt(cheby2.SOS, impulse)))
+
+        _, step = cheby2.step_response(tolerance=1e-6)
+        self.assertEqual(len(step), len(h))
+        self.assertAlmostEqual(step[-1], 1.0, places=5)
+
+        # An FIR filter's impulse response is its taps.
+        fir = digital.FIRFilter(1000)
+        fir.B = signal.firwin(31, 0.3)
+        _, h = fir.impulse_response()
+        self.assertTrue(np.allclose(h, fir.B))
+        with self.assertRaises(ValueError):
+            cheby2.P = np.array([1.5])
+            cheby2.response_length()
+
 
 if __name__ == '__main__':
     unittest.main()
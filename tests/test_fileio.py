@@ -0,0 +1,105 @@
+#!/usr/bin/python3
+# coding: utf-8
+# pyfilter: a Python program for filter synthesis and analysis.
+# (c) 2015 Renan Birck <renan.ee.ufsm@gmail.com>
+
+""" This module is a testbench for filtering recordings in files. """
+import unittest
+import sys
+import os
+import tempfile
+
+sys.path.append('../engine')
+sys.path.append('..')
+
+import numpy as np
+from scipy import signal
+from scipy.io import wavfile
+from engine import digital, fileio
+
+
+class TestFileIO(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory(prefix='pyfilter')
+        self.butterworth = digital.ButterworthFilter()
+        self.butterworth.sample_rate = 8000
+        self.butterworth.N = 4
+        self.butterworth.Wn = 1000
+        self.butterworth.filter_kind = 'lowpass'
+        self.butterworth.design()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_filter_npy(self):
+        """ Chunked filtering must give the same output as
+            filtering the whole array at once. """
+        x = np.random.RandomState(0).randn(10000, 3)
+        np.save(self.path('in.npy'), x)
+
+        frames = fileio.filter_file(self.butterworth, self.path('in.npy'),
+                                    self.path('out.npy'), chunk_size=777)
+        self.assertEqual(frames, 10000)
+
+        expected = signal.sosfilt(self.butterworth.SOS, x, axis=0)
+        output = np.load(self.path('out.npy'))
+        self.assertEqual(output.shape, x.shape)
+        self.assertTrue(np.allclose(output, expected))
+
+    def test_filter_wav(self):
+        x = (np.random.RandomState(1).randn(5000, 2) * 3000).astype(np.int16)
+        wavfile.write(self.path('in.wav'), 8000, x)
+
+        fileio.filter_file(self.butterworth, self.path('in.wav'),
+                           self.path('out.wav'), chunk_size=1000)
+
+        rate, output = wavfile.read(self.path('out.wav'))
+        expected = np.rint(signal.sosfilt(self.butterworth.SOS, x, axis=0))
+        self.assertEqual(rate, 8000)
+        self.assertEqual(output.dtype, np.int16)
+        self.assertTrue(np.array_equal(output, expected.astype(np.int16)))
+
+        self.butterworth.sample_rate = 44100
+        with self.assertRaises(ValueError):
+            fileio.filter_file(self.butterworth, self.path('in.wav'),
+                               self.path('out2.wav'))
+
+    def test_filter_wav_8bit(self):
+        """ 8-bit WAV is unsigned, centered on 128. """
+        x = (128 + np.random.RandomState(3).randn(4999) * 30).clip(0, 255).astype(np.uint8)
+        wavfile.write(self.path('in.wav'), 8000, x)
+        self.butterworth.filter_kind = 'highpass'
+        self.butterworth.design()
+
+        fileio.filter_file(self.butterworth, self.path('in.wav'),
+                           self.path('out.wav'), chunk_size=1000)
+
+        # The odd data chunk is padded, so readers find the end.
+        self.assertEqual(os.path.getsize(self.path('out.wav')) % 2, 0)
+        _, output = wavfile.read(self.path('out.wav'))
+        centered = signal.sosfilt(self.butterworth.SOS, x - 128.0)
+        expected = np.clip(np.rint(centered) + 128, 0, 255)
+        self.assertTrue(np.array_equal(output, expected.astype(np.uint8)))
+
+    def test_filter_raw(self):
+        x = np.random.RandomState(2).randn(3000).astype(np.float32)
+        x.tofile(self.path('in.raw'))
+
+        with self.assertRaises(ValueError):
+            fileio.filter_file(self.butterworth, self.path('in.raw'),
+                               self.path('out.raw'))
+
+        fileio.filter_file(self.butterworth, self.path('in.raw'),
+                           self.path('out.raw'), dtype=np.float32,
+                           chunk_size=512)
+        output = np.fromfile(self.path('out.raw'), dtype=np.float32)
+        expected = signal.sosfilt(self.butterworth.SOS, x)
+        self.assertTrue(np.allclose(output, expected, atol=1e-5))
+
+
+if __name__ == '__main__':
+    unittest.main()
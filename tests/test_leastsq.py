@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+# coding: utf-8
+# pyfilter: a Python program for filter synthesis and analysis.
+# (c) 2015 Renan Birck <renan.ee.ufsm@gmail.com>
+
+""" This module is a testbench for the least squares FIR solver. """
+import unittest
+import sys
+from math import pi
+
+sys.path.append('../engine')
+sys.path.append('..')
+
+import numpy as np
+from scipy import linalg, signal
+from engine import leastsq
+
+
+class TestLeastSquares(unittest.TestCase):
+
+    def setUp(self):
+        self.bands = [(0, 0.2 * pi), (0.3 * pi, pi)]
+        self.desired = [(1, 1), (0, 0)]
+        self.weights = [1, 10]
+
+    def dense(self, column, hankel):
+        size = len(column)
+        return linalg.toeplitz(column) + linalg.hankel(hankel[:size], hankel[size - 1:])
+
+    def test_matvec(self):
+        for taps in [31, 32, 257]:
+            column, hankel, _ = leastsq.normal_equations(taps, self.bands,
+                                                         self.desired, self.weights)
+            x = np.random.RandomState(taps).randn(len(column))
+            product = leastsq.toeplitz_hankel_matvec(column, hankel)(x)
+            self.assertTrue(np.allclose(product, self.dense(column, hankel) @ x))
+
+    def test_solve(self):
+        for taps in [31, 32, 61]:
+            column, hankel, rhs = leastsq.normal_equations(taps, self.bands,
+                                                           self.desired, self.weights)
+            expected = np.linalg.solve(self.dense(column, hankel), rhs)
+            self.assertTrue(np.allclose(leastsq.solve_toeplitz_hankel(column, hankel, rhs),
+                                        expected))
+            self.assertTrue(np.allclose(leastsq.solve_toeplitz_hankel(column, hankel, rhs,
+                                                                      direct_size=0),
+                                        expected))
+
+    def test_not_converged(self):
+        column, hankel, rhs = leastsq.normal_equations(201, self.bands,
+                                                       self.desired, self.weights)
+        with self.assertWarns(RuntimeWarning):
+            leastsq.solve_toeplitz_hankel(column, hankel, rhs, maxiter=3, direct_size=0)
+
+    def test_ridge(self):
+        """ Wide don't-care bands leave the coefficients loose;
+            a ridge keeps them small, at almost no cost in the bands. """
+        bands = [(0, 0.1 * pi), (0.9 * pi, pi)]
+        column, hankel, rhs = leastsq.normal_equations(301, bands, self.desired, [1, 1])
+        loose = leastsq.solve_toeplitz_hankel(column, hankel, rhs)
+        tight = leastsq.solve_toeplitz_hankel(column, hankel, rhs, ridge=1e-8)
+        self.assertLess(np.max(np.abs(tight)), np.max(np.abs(loose)))
+
+        W = np.linspace(0, 0.1 * pi, 200)
+        amplitude = lambda a: np.cos(np.outer(W, np.arange(len(a)))) @ a
+        self.assertLess(np.max(np.abs(amplitude(tight) - 1)), 1e-3)
+
+    def test_against_firls(self):
+        """ The stopbands come out as deep as those of signal.firls,
+            solved directly or by conjugate gradients. """
+        specs = [(1001, [(0, 0.2 * pi), (0.22 * pi, pi)], [(1, 1), (0, 0)], [1, 1]),
+                 (201, [(0, 0.1 * pi), (0.2 * pi, 0.4 * pi), (0.5 * pi, pi)],
+                  [(0, 0), (1, 1), (0, 0)], [10, 1, 10]),
+                 (4001, [(0, 0.2 * pi), (0.205 * pi, pi)], [(1, 1), (0, 0)], [1, 1])]
+        for taps, bands, desired, weights in specs:
+            column, hankel, rhs = leastsq.normal_equations(taps, bands, desired, weights)
+            half = leastsq.solve_toeplitz_hankel(column, hankel, rhs) / 2
+            B = np.concatenate((half[:0:-1], [2 * half[0]], half[1:]))
+            expected = signal.firls(taps, np.ravel(bands) / pi, np.ravel(desired), weight=weights)
+
+            for (start, stop), (gain, _) in zip(bands, desired):
+                if gain == 0:
+                    W = np.linspace(start, stop, 4096)
+                    peak = lambda h: 20 * np.log10(np.max(np.abs(signal.freqz(h, worN=W)[1])))
+                    self.assertLess(peak(B), peak(expected) + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,358 @@
+#!/usr/bin/python3
+# coding: utf-8
+# pyfilter: a Python program for filter synthesis and analysis.
+# (c) 2015 Renan Birck <renan.ee.ufsm@gmail.com>
+
+""" This module is a testbench for the frequency response tools. """
+import unittest
+import sys
+from math import pi
+
+sys.path.append('../engine')
+sys.path.append('..')
+
+import numpy as np
+from scipy import signal
+from engine import digital, analog_new, response
+
+
+class TestFrequencyGrid(unittest.TestCase):
+
+    def test_grid_points(self):
+        linear = response.FrequencyGrid(0, 100, 11)
+        self.assertTrue(np.allclose(linear.frequencies(), np.arange(0, 101, 10)))
+
+        log = response.FrequencyGrid(1, 1000, 4, scale='log')
+        self.assertTrue(np.allclose(log.frequencies(), [1, 10, 100, 1000]))
+
+        # Up to Nyquist when there is no stop.
+        nyquist = response.FrequencyGrid(num=5)
+        self.assertTrue(np.allclose(nyquist.frequencies(1000), [0, 125, 250, 375, 500]))
+        self.assertTrue(np.allclose(nyquist.angular(1000), np.linspace(0, pi, 5)))
+
+        # Computed once, then reused.
+        self.assertIs(log.angular(1000), log.angular(1000))
+        self.assertEqual(response.FrequencyGrid(points=[1, 2]).key,
+                         response.FrequencyGrid(points=np.array([1.0, 2.0])).key)
+
+        with self.assertRaises(ValueError):
+            response.FrequencyGrid(0, 10, scale='log')
+        with self.assertRaises(ValueError):
+            response.FrequencyGrid(units='normalized').angular()
+
+    def test_digital_grid(self):
+        cheby1 = digital.ChebyshevIFilter()
+        cheby1.sample_rate = 1000
+        cheby1.N = 4
+        cheby1.Wn = 100
+        cheby1.ripple = 1
+        cheby1.filter_kind = 'lowpass'
+        cheby1.design()
+
+        grid = response.FrequencyGrid(10, 400, 50, scale='log')
+        cheby1.compute_frequencies(grid=grid)
+        _, expected = signal.freqz(cheby1.B, cheby1.A, worN=grid.frequencies(), fs=1000)
+        self.assertTrue(np.allclose(cheby1.W, 2 * pi * grid.frequencies() / 1000))
+        self.assertTrue(np.allclose(cheby1.H, expected))
+
+        normalized = response.FrequencyGrid(points=[0.2, 0.8], units='normalized')
+        cheby1.compute_frequencies(grid=normalized)
+        self.assertTrue(np.allclose(cheby1.W, [0.2 * pi, 0.8 * pi]))
+
+    def test_analog_grid(self):
+        butter = analog_new.ButterworthFilter()
+        butter.N = 3
+        butter.Wn = 2 * pi * 100
+        butter.filter_kind = 'lowpass'
+        butter.design()
+
+        grid = response.FrequencyGrid(1, 1000, 30, scale='log')
+        butter.compute_frequencies(grid=grid)
+        _, expected = signal.freqs(butter.B, butter.A, worN=2 * pi * grid.frequencies())
+        self.assertTrue(np.allclose(butter.H, expected))
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def test_memoized_until_redesign(self):
+        responses = digital.Filter.response_cache
+        responses.clear()
+        butter = digital.ButterworthFilter()
+        butter.sample_rate = 1000
+        butter.N = 4
+        butter.Wn = 100
+        butter.filter_kind = 'lowpass'
+        butter.design()
+
+        butter.compute_frequencies(N=1000)
+        first = butter.H
+        butter.compute_frequencies(N=1000)
+        self.assertIs(butter.H, first)
+        self.assertEqual(responses.info()['hits'], 1)
+        with self.assertRaises(ValueError):
+            butter.H[0] = 0  # Shared, so read-only.
+
+        # Another grid, or new coefficients, are computed again.
+        butter.compute_frequencies(N=100)
+        butter.N = 5
+        butter.design()
+        butter.compute_frequencies(N=1000)
+        self.assertEqual(responses.info()['misses'], 3)
+        self.assertFalse(np.allclose(butter.H, first))
+
+
+class TestFactoredResponse(unittest.TestCase):
+
+    def test_digital_zpk_and_sos(self):
+        Z, P, K = signal.ellip(12, 0.5, 80, [0.2, 0.3], 'bandpass', output='zpk')
+        SOS = signal.zpk2sos(Z, P, K)
+        W = np.linspace(0, pi, 1000)
+        _, expected = signal.sosfreqz(SOS, worN=W)
+        self.assertTrue(np.allclose(response.zpk_response(Z, P, K, W), expected))
+        self.assertTrue(np.allclose(response.sos_response(SOS, W), expected))
+        self.assertTrue(np.allclose(response.zpk_log_magnitude(Z, P, K, W),
+                                    np.log(np.abs(expected))))
+
+    def test_high_order_analog(self):
+        """ Evaluated from B/A, this filter has a gain of 8 at the
+            cutoff; from the factors, it has the right one. """
+        butter = analog_new.ButterworthFilter()
+        butter.N = 60
+        butter.Wn = 2 * pi * 1e4
+        butter.filter_kind = 'lowpass'
+        butter.design()
+
+        H = butter.evaluate([2 * pi * 1e3, 2 * pi * 1e4, 2 * pi * 2e4])
+        self.assertAlmostEqual(abs(H[0]), 1.0)
+        self.assertAlmostEqual(abs(H[1]), 1 / np.sqrt(2))
+        self.assertAlmostEqual(20 * np.log10(abs(H[2])), -60 * 20 * np.log10(2), places=6)
+
+        butter.compute_frequencies(N=300)
+        self.assertEqual(len(butter.W), 300)
+        self.assertTrue(np.all(np.isfinite(butter.H)))
+
+
+class TestDelays(unittest.TestCase):
+
+    def test_digital_group_delay(self):
+        elliptic = digital.EllipticFilter()
+        elliptic.sample_rate = 1000
+        elliptic.N = 6
+        elliptic.Wn = 100
+        elliptic.ripple = 1
+        elliptic.stopband_attenuation = 60
+        elliptic.filter_kind = 'lowpass'
+        elliptic.design()
+
+        elliptic.compute_delays(N=256)
+        _, expected = signal.group_delay((elliptic.B, elliptic.A), w=elliptic.W)
+        self.assertTrue(np.allclose(elliptic.group_delay, expected, rtol=1e-6))
+
+        # The same from the sections alone, and from the polynomials.
+        sections = digital.IIRFilter()
+        sections.sample_rate = 1000
+        sections.SOS = elliptic.SOS
+        self.assertTrue(np.allclose(sections.evaluate_group_delay(elliptic.W), expected,
+                                    rtol=1e-6))
+
+        # Memoized with the response.
+        delay = elliptic.group_delay
+        elliptic.compute_delays(N=256)
+        self.assertIs(elliptic.group_delay, delay)
+
+    def test_linear_phase_fir(self):
+        fir = digital.FIRFilter(1000)
+        fir.B = signal.firwin(101, 0.3)
+        grid = response.FrequencyGrid(0, 140, 15)  # Coarse, in the passband.
+        fir.compute_delays(grid=grid)
+        self.assertTrue(np.allclose(fir.group_delay, 50))
+        self.assertTrue(np.allclose(fir.phase_delay, 50))
+
+    def test_phase_delay_above_dc(self):
+        elliptic = digital.EllipticFilter()
+        elliptic.sample_rate = 1000
+        elliptic.N = 8
+        elliptic.Wn = 100
+        elliptic.ripple = 0.5
+        elliptic.stopband_attenuation = 60
+        elliptic.filter_kind = 'lowpass'
+        elliptic.design()
+
+        # The phase of a grid from 80 Hz on must count the turns below it.
+        elliptic.compute_delays(grid=response.FrequencyGrid(80, 99, 20))
+        W = np.linspace(0, elliptic.W[-1], 200001)
+        phase = np.unwrap(np.angle(signal.freqz(elliptic.B, elliptic.A, worN=W)[1]))
+        expected = -np.interp(elliptic.W, W, phase) / elliptic.W
+        self.assertTrue(np.allclose(elliptic.phase_delay, expected, rtol=1e-4))
+
+    def test_analog_delays(self):
+        bessel = analog_new.BesselFilter()
+        bessel.N = 5
+        bessel.Wn = 2 * pi * 1000
+        bessel.filter_kind = 'lowpass'
+        bessel.design()
+
+        W = np.linspace(0, 2 * pi * 400, 2001)
+        phase = np.unwrap(np.angle(bessel.evaluate(W)))
+        numeric = -np.gradient(phase, W)
+        analytic = bessel.evaluate_group_delay(W)
+        self.assertTrue(np.allclose(analytic[1:-1], numeric[1:-1], rtol=1e-4))
+
+        # Well below the cutoff, a Bessel filter delays all equally.
+        bessel.compute_delays(grid=response.FrequencyGrid(1, 100, 20, scale='log'))
+        self.assertTrue(np.allclose(bessel.phase_delay, bessel.group_delay, rtol=1e-3))
+
+
+class TestAdaptiveResponse(unittest.TestCase):
+
+    def test_elliptic_extrema(self):
+        elliptic = digital.EllipticFilter()
+        elliptic.sample_rate = 8000
+        elliptic.set_parameters({'passband_frequency': 1000.0,
+                                 'stopband_frequency': 1200.0,
+                                 'passband_attenuation': 0.5,
+                                 'stopband_attenuation': 60,
+                                 'ripple': 0.5})
+        elliptic.compute_parameters()
+        elliptic.design()
+
+        found = elliptic.adaptive_response()
+        self.assertEqual([band.kind for band in found.bands], ['pass', 'stop'])
+        self.assertLess(len(found.W), 250)
+        self.assertTrue(np.all(np.diff(found.W) >= 0))
+
+        # A dense grid finds the same worst cases.
+        dense = np.linspace(0, pi, 200000)
+        db = response.magnitude_db(elliptic.evaluate(dense))
+        passband, stopband = found.bands
+        in_pass = dense <= passband.stop
+        in_stop = dense >= stopband.start
+        self.assertAlmostEqual(passband.minimum[1], db[in_pass].min(), delta=0.01)
+        self.assertAlmostEqual(passband.maximum[1], db[in_pass].max(), delta=0.01)
+        self.assertAlmostEqual(stopband.maximum[1], db[in_stop].max(), delta=0.01)
+        self.assertGreater(len(passband.extrema), 2)  # The ripple.
+
+    def test_analog_bands(self):
+        butter = analog_new.ButterworthFilter()
+        butter.target = 'passband'
+        butter.set_parameters({'passband_frequency': [100.0, 200.0],
+                               'stopband_frequency': [50.0, 400.0],
+                               'passband_attenuation': 1,
+                               'stopband_attenuation': 30})
+        butter.compute_parameters()
+        butter.design()
+
+        edges = butter.band_edges()
+        self.assertEqual([kind for kind, _, _ in edges], ['stop', 'pass', 'stop'])
+        self.assertAlmostEqual(edges[2][2], 10 * 2 * pi * 400)
+
+        found = butter.adaptive_response()
+        self.assertGreaterEqual(found.bands[1].minimum[1], -1 - 1e-6)
+        self.assertLessEqual(found.bands[0].maximum[1], -30 + 1e-6)
+        self.assertLessEqual(found.bands[2].maximum[1], -30 + 1e-6)
+
+
+class TestVerify(unittest.TestCase):
+
+    def make_elliptic(self):
+        elliptic = digital.EllipticFilter()
+        elliptic.sample_rate = 8000
+        elliptic.set_parameters({'passband_frequency': 1000.0,
+                                 'stopband_frequency': 1200.0,
+                                 'passband_attenuation': 0.5,
+                                 'stopband_attenuation': 60,
+                                 'ripple': 0.5})
+        elliptic.compute_parameters()
+        elliptic.design()
+        return elliptic
+
+    def test_compliant(self):
+        passed, margins = self.make_elliptic().verify()
+        self.assertTrue(passed)
+        self.assertEqual([band.kind for band in margins], ['pass', 'stop'])
+        self.assertAlmostEqual(margins[0].margin, 0, places=6)  # Meets it exactly.
+        self.assertAlmostEqual(margins[1].limit, -60)
+
+    def test_violation(self):
+        elliptic = self.make_elliptic()
+        elliptic.stopband_attenuation = 50
+        elliptic.design()
+
+        passed, margins = elliptic.verify(early_exit=False)
+        self.assertFalse(passed)
+        self.assertAlmostEqual(margins[1].margin, 50 - 60, delta=0.01)
+
+        # Stopping at the first violation sees it already at the edges.
+        passed, margins = elliptic.verify()
+        self.assertFalse(passed)
+        self.assertLess(margins[1].margin, 0)
+
+    def test_narrow_band(self):
+        """ A notch inside a passband narrower than the grid step
+            must still be found. """
+        notched = digital.IIRFilter()
+        notched.sample_rate = 48000
+        notched.B, notched.A = signal.iirnotch(1001, 2000, fs=48000)
+        notched.set_parameters({'passband_frequency': [990.0, 1012.0],
+                                'stopband_frequency': [900.0, 1100.0],
+                                'passband_attenuation': 1,
+                                'stopband_attenuation': None})
+        passed, margins = notched.verify(N=512)
+        self.assertFalse(passed)
+        self.assertLess(margins[0].worst[1], -3)
+        self.assertAlmostEqual(margins[0].worst[0], 2 * pi * 1001 / 48000, delta=1e-4)
+
+    def test_fir_against_freqz(self):
+        """ The chirp-Z transform of each band finds the worst points
+            freqz finds on a finer grid, to a fraction of a ripple. """
+        fir = digital.FIRFilter(8000)
+        fir.set_parameters({'passband_frequency': 1000.0,
+                            'stopband_frequency': 1100.0,
+                            'passband_attenuation': 0.1,
+                            'stopband_attenuation': 60})
+        fir.compute_parameters()
+        passed, margins = fir.verify(early_exit=False)
+        self.assertTrue(passed)
+        for band in margins:
+            W = np.linspace(band.start, band.stop, 4096)
+            _, H = signal.freqz(fir.B, worN=W)
+            dB = 20 * np.log10(np.abs(H))
+            worst = np.min(dB) if band.kind == 'pass' else np.max(dB)
+            self.assertAlmostEqual(band.worst[1], worst, delta=0.05)
+
+
+class TestBatchFIRResponse(unittest.TestCase):
+
+    def test_against_freqz(self):
+        random = np.random.RandomState(0)
+        coefficients = random.randn(20, 65)
+        designs = []
+        for B in coefficients[:3]:
+            fir = digital.FIRFilter(1000)
+            fir.B = B
+            designs.append(fir)
+
+        for N in [512, 16]:  # 16 points: the taps wrap around the FFT.
+            W, H = response.batch_fir_response(coefficients, N=N)
+            self.assertEqual(H.shape, (20, N))
+            for idx in [0, 7, 19]:
+                W_ref, H_ref = signal.freqz(coefficients[idx], worN=N)
+                self.assertTrue(np.allclose(W, W_ref))
+                self.assertTrue(np.allclose(H[idx], H_ref))
+
+        W, H = response.batch_fir_response(designs, N=100)
+        self.assertTrue(np.allclose(H[2], signal.freqz(coefficients[2], worN=100)[1]))
+
+    def test_single_precision(self):
+        coefficients = np.random.RandomState(1).randn(5, 33)
+        _, H = response.batch_fir_response(coefficients, N=256, dtype=np.float32)
+        _, H_ref = response.batch_fir_response(coefficients, N=256)
+        self.assertEqual(H.dtype, np.complex64)
+        self.assertTrue(np.allclose(H, H_ref, atol=1e-4))
+
+        with self.assertRaises(ValueError):
+            response.batch_fir_response([np.ones(3), np.ones(4)])
+
+
+if __name__ == '__main__':
+    unittest.main()